@@ -0,0 +1,9 @@
+default_app_config = 'rolez.apps.RolezConfig'
+
+
+def trace():
+    """
+    record the permission checks made in a with block; see rolez.tracing.trace
+    """
+    from rolez.tracing import trace
+    return trace()
@@ -0,0 +1,92 @@
+from django.contrib import admin
+from django.contrib.auth.models import Permission
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# nothing is registered here; the role model is swappable. e.g. in the admin.py of an app:
+#
+#     admin.site.register(Permission, PermissionAdmin)  # backs the permission pickers
+#     admin.site.register(Role, RoleAdmin)
+#
+#     class UserAdmin(UserRoleAdminMixin, auth.admin.UserAdmin): ...
+
+
+def _select_content_type(formfield):
+    # the autocomplete widgets render the selected perms only, each with its content type
+    if formfield is not None and formfield.queryset.model is Permission:
+        formfield.queryset = formfield.queryset.select_related('content_type')
+    return formfield
+
+
+def _count(model, name, **filters):
+    # a correlated subquery counting the rows of the m2m name per object; joining two m2ms
+    # in one query would multiply their rows
+    field = model._meta.get_field(name)
+    source = field.m2m_field_name()
+    counts = field.remote_field.through.objects \
+        .filter(**{source: OuterRef('pk')}, **filters).order_by() \
+        .values(source).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class PermissionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'codename', 'content_type')
+    list_select_related = ('content_type',)
+    list_filter = ('content_type__app_label',)
+    search_fields = ('name', 'codename', 'content_type__app_label')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('content_type')
+
+
+class RoleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'perm_count')
+    search_fields = ('name',)
+    readonly_fields = ('delegate',)  # created with the role
+    autocomplete_fields = ('perms',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('delegate__content_type') \
+            .annotate(perm_count=Count('perms', distinct=True))
+
+    def perm_count(self, obj):
+        return obj.perm_count
+    perm_count.admin_order_field = 'perm_count'
+    perm_count.short_description = 'permissions'
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        return _select_content_type(super().formfield_for_manytomany(db_field, request, **kwargs))
+
+
+class UserRoleAdminMixin(object):
+    """
+    for the UserAdmin of a user model using roles; autocomplete group, permission and role
+    (if the user has a roles list) pickers, and the number of roles a user is given directly
+    """
+    autocomplete_fields = ('groups', 'user_permissions')
+
+    def get_autocomplete_fields(self, request):
+        fields = tuple(super().get_autocomplete_fields(request))
+        if hasattr(self.model, 'roles') and 'roles' not in fields:
+            fields += ('roles',)
+        return fields
+
+    def get_list_display(self, request):
+        return tuple(super().get_list_display(request)) + ('role_count',)
+
+    def get_queryset(self, request):
+        # role delegates in user_permissions, and the roles list if any
+        field = self.model._meta.get_field('user_permissions')
+        role_count = _count(self.model, 'user_permissions',
+                            **{field.m2m_reverse_field_name() + '__role__isnull': False})
+        if hasattr(self.model, 'roles'):
+            role_count += _count(self.model, 'roles')
+        return super().get_queryset(request).annotate(role_count=role_count)
+
+    def role_count(self, obj):
+        return obj.role_count
+    role_count.admin_order_field = 'role_count'
+    role_count.short_description = 'roles'
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        return _select_content_type(super().formfield_for_manytomany(db_field, request, **kwargs))
@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class RolezConfig(AppConfig):
     name = 'rolez'
+
+    def ready(self):
+        import rolez.checks  # noqa: registers the system checks
+        from rolez.signals import connect_signals
+        from rolez.warm import warm_on_ready
+        connect_signals()
+        warm_on_ready()
@@ -1,8 +1,14 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
+from django.db.models import Q
 
-from rolez.util import str_to_perm, clear_cache, get_cache_key, perms_to_str, get_delegates, \
-    get_roles_perms
+from rolez.cache import get_or_build_shared_perms, get_or_build_shared_obj_perm, BACKEND_PERMS
+from rolez.util import clear_cache, get_cache_key, perms_to_str, get_roles_perms, \
+    get_nested_roles, get_role_model, get_read_db, test_roles_for_perm, check_lazily, \
+    get_perm_filter, get_default_perms, get_role_index, get_tenant
+from rolez.budget import guarded
+from rolez.scope import has_scoped_role_perm
+from rolez.tracing import note, step
 
 
 class RoleModelBackend(object):
@@ -12,20 +18,27 @@ class RoleModelBackend(object):
     def authenticate(self, username, password):
         return None
 
+    def _get_delegated_permissions(self, delegates):
+        # perms of the roles delegated, and of the roles nested in them
+        roles = get_role_model().objects.filter(delegate__in=delegates)
+        return Permission.objects.using(get_read_db()).filter(roles__in=get_nested_roles(roles))
+
     def _get_user_permissions(self, user_obj):
-        return Permission.objects.filter(roles__delegate__in=user_obj.user_permissions.all())
+        return self._get_delegated_permissions(user_obj.user_permissions.all())
 
     def _get_group_permissions(self, user_obj):
         user_groups_field = get_user_model()._meta.get_field('groups')
         group_perms = Permission.objects.filter(
             **{'group__' + user_groups_field.related_query_name(): user_obj})
-        return Permission.objects.filter(roles__delegate__in=group_perms)
+        return self._get_delegated_permissions(group_perms)
 
     def _get_permissions(self, user_obj, obj, from_name):
         if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
             return set()
         perm_cache_name = '_%s_role_model_cache' % from_name
-        if not hasattr(user_obj, perm_cache_name):
+        if hasattr(user_obj, perm_cache_name):
+            note('cache hit', cache=perm_cache_name)
+        else:
             perms = getattr(self, '_get_%s_permissions' % from_name)(user_obj)
             perms = perms_to_str(perms)
             setattr(user_obj, perm_cache_name, perms)
@@ -37,16 +50,39 @@ class RoleModelBackend(object):
     def get_group_permissions(self, user_obj, obj=None):
         return self._get_permissions(user_obj, obj, 'group')
 
+    @guarded('get_all_permissions')
     def get_all_permissions(self, user_obj, obj=None):
         if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
             return set()
-        if not hasattr(user_obj, '_role_model_cache'):
-            user_obj._role_model_cache = set()
-            user_obj._role_model_cache.update(self.get_user_permissions(user_obj))
-            user_obj._role_model_cache.update(self.get_group_permissions(user_obj))
+        if hasattr(user_obj, '_role_model_cache'):
+            note('cache hit', cache='_role_model_cache')
+        else:
+            def build():
+                return self.get_user_permissions(user_obj) | self.get_group_permissions(user_obj)
+            user_obj._role_model_cache = set(
+                get_or_build_shared_perms(user_obj, BACKEND_PERMS, build))
         return user_obj._role_model_cache
 
+    def _has_perm_exists(self, user_obj, perm):
+        # user and group delegates at once
+        UserModel = get_user_model()
+        user_perms_field = UserModel._meta.get_field('user_permissions')
+        user_groups_field = UserModel._meta.get_field('groups')
+        delegates = Permission.objects.filter(
+            Q(**{user_perms_field.related_query_name(): user_obj})
+            | Q(**{'group__' + user_groups_field.related_query_name(): user_obj}))
+        return self._get_delegated_permissions(delegates).filter(**get_perm_filter(perm)).exists()
+
+    @guarded('has_perm')
     def has_perm(self, user_obj, perm, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return False
+        if not hasattr(user_obj, '_role_model_cache'):
+            # a few perms with an exists each, rather than loading all for them
+            granted = check_lazily(user_obj, '_role_model_checked', perm,
+                                   lambda: self._has_perm_exists(user_obj, perm))
+            if granted is not None:
+                return granted
         return perm in self.get_all_permissions(user_obj, obj)
 
     def has_module_perms(self, user_obj, app_label):
@@ -69,19 +105,35 @@ class RoleListModelBackend(object):
     def authenticate(self, username, password):
         return None
 
+    def _get_roles(self, user_obj):
+        if not hasattr(user_obj, 'roles'):
+            raise ValueError('roles not found on user.')
+        return user_obj.roles.all()
+
+    @guarded('get_all_permissions')
     def get_all_permissions(self, user_obj, obj=None):
         if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
             return set()
         perm_cache_name = '_roles_perm_cache'
-        if not hasattr(user_obj, perm_cache_name):
-            if not hasattr(user_obj, 'roles'):
-                raise ValueError ('roles not found on user.')
-            perms = get_roles_perms(user_obj.roles)
+        if hasattr(user_obj, perm_cache_name):
+            note('cache hit', cache=perm_cache_name)
+        else:
+            # a single query, the roles of the user in a subquery
+            perms = get_roles_perms(self._get_roles(user_obj))
             perms = set(perms_to_str(perms))
             setattr(user_obj, perm_cache_name, perms)
         return getattr(user_obj, perm_cache_name)
 
+    @guarded('has_perm')
     def has_perm(self, user_obj, perm, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return False
+        if not hasattr(user_obj, '_roles_perm_cache'):
+            # a few perms with an exists each, rather than loading all for them
+            granted = check_lazily(user_obj, '_roles_perm_checked', perm,
+                                   lambda: test_roles_for_perm(self._get_roles(user_obj), perm))
+            if granted is not None:
+                return granted
         return perm in self.get_all_permissions(user_obj, obj)
 
     def has_module_perms(self, user_obj, app_label):
@@ -115,8 +167,9 @@ class RoleObjectBackend(object):
     # 		pass
 
     @staticmethod
+    @guarded('has_perm')
     def has_perm(user_obj, perm, obj=None):
-        if obj is None:
+        if not user_obj.is_active or user_obj.is_anonymous or obj is None:
             return False
 
         if not hasattr(user_obj, '_role_obj_cache'):
@@ -126,20 +179,89 @@ class RoleObjectBackend(object):
         # depending on the # of roles having that perm, could perform better
 
         key = get_cache_key(obj, perm)
-        if key not in user_obj._role_obj_cache:
-            user_obj._role_obj_cache[key] = False
-            perm = str_to_perm(perm)
-            if not hasattr(perm, 'role'):
-                # check regular perms; i.e. exclude delegates, not to get in a infinite loop
-                # if could django allowed choosing backends, would also be possible
-                # to include roles in roles (delegates in role permissions)
-                for delegate in get_delegates(perm):
-                    if user_obj.has_perm(delegate, obj):  # ??!
-                        user_obj._role_obj_cache[key] = True
+        if key in user_obj._role_obj_cache:
+            note('cache hit', cache='_role_obj_cache')
+        else:
+            user_obj._role_obj_cache[key] = False  # while the delegates are checked
+            user_obj._role_obj_cache[key] = get_or_build_shared_obj_perm(
+                user_obj, perm, obj,
+                lambda: RoleObjectBackend._has_delegated_perm(user_obj, perm, obj))
         return user_obj._role_obj_cache[key]
 
+    @staticmethod
+    def _has_delegated_perm(user_obj, perm, obj):
+        # the role index tells the delegates apart, and the ones granting perm; no queries
+        # per delegate. check regular perms only; i.e. exclude delegates, not to get in a
+        # infinite loop. nested roles are still covered, the index includes the perms of
+        # the roles nested in a role (see rolez.closure)
+        role_index = get_role_index(get_tenant(user_obj))
+        if perm not in role_index:
+            for delegate, perms in role_index.items():
+                if perm in perms:
+                    with step('delegate', perm=delegate):
+                        if user_obj.has_perm(delegate, obj):  # ??!
+                            return True
+        return False
+
     def get_cache_key(self, obj, perm):
         return (obj._meta.app_label, obj._meta.model_name, obj.pk, perm)
 
 # 	def has_module_perms(self, user_obj, app_label):
 # 		pass
+
+
+class RoleScopeBackend(object):
+    """
+    object level permission for roles assigned on scope objects (see rolez.models.RoleAssignment)
+    """
+    def clear_cache(self, user):
+        clear_cache(user)
+
+    def authenticate(self, username, password):
+        return None
+
+    @guarded('has_perm')
+    def has_perm(self, user_obj, perm, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is None:
+            return False
+
+        if not hasattr(user_obj, '_role_scope_cache'):
+            user_obj._role_scope_cache = {}
+
+        key = get_cache_key(obj, perm)
+        if key in user_obj._role_scope_cache:
+            note('cache hit', cache='_role_scope_cache')
+        else:
+            user_obj._role_scope_cache[key] = has_scoped_role_perm(user_obj, perm, obj)
+        return user_obj._role_scope_cache[key]
+
+
+class RoleDefaultBackend(object):
+    """
+    model level permission for the default roles of anonymous and of all authenticated users
+    (see rolez.util.get_default_perms); no per user queries or rows
+    """
+    def clear_cache(self, user):
+        clear_cache(user)
+
+    def authenticate(self, username, password):
+        return None
+
+    @guarded('get_all_permissions')
+    def get_all_permissions(self, user_obj, obj=None):
+        if obj is not None:
+            return set()
+        return set(get_default_perms(user_obj))
+
+    @guarded('has_perm')
+    def has_perm(self, user_obj, perm, obj=None):
+        return obj is None and perm in get_default_perms(user_obj)
+
+    def has_module_perms(self, user_obj, app_label):
+        """
+        Return True if the default roles of user_obj have permissions in the given app_label.
+        """
+        for perm in get_default_perms(user_obj):
+            if perm[:perm.index('.')] == app_label:
+                return True
+        return False
@@ -0,0 +1,97 @@
+import inspect
+import logging
+import os
+import threading
+import traceback
+from contextlib import ExitStack
+from functools import wraps
+
+import django
+from django.conf import settings
+from django.db import connections
+
+import rolez
+
+logger = logging.getLogger('rolez')
+_local = threading.local()
+
+_skipped_dirs = tuple(os.path.dirname(module.__file__) + os.sep for module in (rolez, django))
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def get_budgets():
+    """
+    the query budgets of the permission APIs, settings.ROLE_QUERY_BUDGETS, like:
+
+        {'has_perm': 2, 'has_obj_perm': 2, 'get_all_permissions': 2,
+         'UserRoleMixin.has_perm': 6}
+
+    keys are an api, has_obj_perm being has_perm with an obj, optionally prefixed with a
+    backend (or UserRoleMixin) class name; None, the default, turns the guard off
+    """
+    return getattr(settings, 'ROLE_QUERY_BUDGETS', None)
+
+
+def _get_call_site():
+    # the innermost frame outside rolez and django
+    for frame in reversed(traceback.extract_stack()):
+        if not frame.filename.startswith(_skipped_dirs):
+            return '%s:%s in %s' % (frame.filename, frame.lineno, frame.name)
+    return None
+
+
+def _report(name, budget, queries, call_site):
+    message = '%s made %s queries, over its budget of %s, at %s' % (
+        name, len(queries), budget, call_site)
+    if getattr(settings, 'ROLE_QUERY_BUDGET_RAISE', False):
+        raise QueryBudgetExceeded('\n'.join([message] + queries))
+    logger.warning(message, extra={'rolez_budget': {
+        'api': name, 'budget': budget, 'queries': queries, 'call_site': call_site}})
+
+
+def guarded(api):
+    """
+    count the queries of calls of the decorated permission API (has_perm or
+    get_all_permissions) when settings.ROLE_QUERY_BUDGETS is set, and log a warning to the
+    'rolez' logger, or raise QueryBudgetExceeded if settings.ROLE_QUERY_BUDGET_RAISE is True,
+    with the call site and the queries when a call goes over its budget. calls made within a
+    guarded call count towards it
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        owner = func.__qualname__.split('.')[0]
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            budgets = get_budgets()
+            if not budgets or getattr(_local, 'queries', None) is not None:
+                return func(*args, **kwargs)
+
+            name = api
+            if api == 'has_perm' and signature.bind(*args, **kwargs).arguments.get('obj'):
+                name = 'has_obj_perm'
+            name = '%s.%s' % (owner, name)
+            budget = budgets.get(name, budgets.get(name.split('.')[1]))
+            if budget is None:
+                return func(*args, **kwargs)
+
+            def count(execute, sql, params, many, context):
+                _local.queries.append(sql)
+                return execute(sql, params, many, context)
+
+            _local.queries = queries = []
+            try:
+                with ExitStack() as stack:
+                    for connection in connections.all():
+                        stack.enter_context(connection.execute_wrapper(count))
+                    result = func(*args, **kwargs)
+            finally:
+                _local.queries = None
+            if len(queries) > budget:
+                _report(name, budget, queries, _get_call_site())
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+
+from rolez.generation import check_generation, bump_obj_generation, _get_cache, \
+    OBJ_GENERATION_KEY
+
+# kinds of shared effective permission entries
+BACKEND_PERMS = 'backend'  # RoleModelBackend.get_all_permissions, role perms only
+MIXIN_PERMS = 'mixin'  # UserRoleMixin.get_all_role_perms, all perms with the roles expanded
+
+
+def is_enabled():
+    """
+    shared (L2) effective perms and object check results are kept in settings.ROLE_CACHE
+    when settings.ROLE_SHARED_CACHE is True, for settings.ROLE_SHARED_CACHE_TIMEOUT seconds
+    (300 by default)
+    """
+    return getattr(settings, 'ROLE_SHARED_CACHE', False)
+
+
+def _get_timeout():
+    return getattr(settings, 'ROLE_SHARED_CACHE_TIMEOUT', 300)
+
+
+def _get_key(kind, user_pk, generation):
+    # the generation in the key drops the entries of all users on a role graph change
+    return 'rolez:perms:%s:%s:%s' % (kind, generation, user_pk)
+
+
+def get_or_build_shared_perms(user_obj, kind, build):
+    """
+    return the shared entry of user_obj, a frozenset of perm strings, calling build and
+    storing its result on a miss; just build when shared entries are disabled
+    """
+    if not is_enabled():
+        return build()
+    generation = check_generation()  # before building; a change meanwhile makes a new key
+    key = _get_key(kind, user_obj.pk, generation)
+    cache = _get_cache()
+    perms = cache.get(key)
+    if perms is None:
+        perms = frozenset(build())
+        cache.set(key, perms, _get_timeout())
+    return perms
+
+
+def set_shared_perms(kind, perms_by_user, generation):
+    """
+    store {user pk: perms}, built at generation, as shared entries in a single cache call
+    """
+    if not perms_by_user:
+        return
+    _get_cache().set_many({_get_key(kind, pk, generation): frozenset(perms)
+                           for pk, perms in perms_by_user.items()}, _get_timeout())
+
+
+def get_or_build_shared_obj_perm(user_obj, perm, obj, build):
+    """
+    return the shared result of an object check through roles, calling build and storing its
+    result, positive or negative, on a miss; just build when shared entries are disabled, or
+    for inactive users. results are dropped on a role graph change, and on an object perm
+    change (see rolez.generation.bump_obj_generation)
+    """
+    if not is_enabled() or not user_obj.is_active:  # a deactivated user has no results
+        return build()
+    generation = check_generation()
+    content_type = ContentType.objects.get_for_model(obj)  # cached by django
+    key = 'rolez:obj:%s:%s:%s:%s:%s' % (generation, user_obj.pk, content_type.pk, obj.pk, perm)
+    cache = _get_cache()
+    # the object perm generation is read with the result, and stored in it; one round trip
+    values = cache.get_many([OBJ_GENERATION_KEY, key])
+    obj_generation = values.get(OBJ_GENERATION_KEY)
+    if obj_generation is None:
+        obj_generation = bump_obj_generation()
+    if key in values and values[key][0] == obj_generation:
+        return bool(values[key][1])
+    granted = build()
+    cache.set(key, (obj_generation, int(granted)), _get_timeout())
+    return granted
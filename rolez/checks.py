@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# cache backends not shared between processes
+_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_generation_store(app_configs, **kwargs):
+    """
+    the role graph generation must be shared by all processes (web workers, task workers):
+    snapshots of another process are stale otherwise, and role changes never reach the
+    process local caches of the others
+    """
+    if getattr(settings, 'ROLE_GENERATION_STORE', 'cache') == 'database':
+        return []
+    alias = getattr(settings, 'ROLE_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in _LOCAL_CACHES:
+        return []
+    return [Warning(
+        'The role graph generation is kept in a cache local to the process (%s).' % alias,
+        hint="Set ROLE_GENERATION_STORE = 'database', or ROLE_CACHE to a cache shared by "
+             "all processes, e.g. memcached or redis, unless a single process serves the site.",
+        id='rolez.W001',
+    )]
@@ -0,0 +1,152 @@
+from collections import defaultdict, deque
+
+from django.db.models import Q
+
+from rolez.models import RoleClosure, AbstractTenantRole
+from rolez.util import get_role_model
+
+
+class RoleCycleError(ValueError):
+    pass
+
+
+class RoleTenantError(ValueError):
+    pass
+
+
+def _get_children():
+    """
+    return {role pk: {pks of the roles whose delegates are in its perms}}
+    """
+    field = get_role_model().perms.field
+    perm_name = field.m2m_reverse_field_name()
+    children = defaultdict(set)
+    edges = field.remote_field.through.objects \
+        .filter(**{perm_name + '__role__isnull': False}) \
+        .values_list(field.m2m_field_name(), perm_name + '__role')
+    for parent, child in edges:
+        children[parent].add(child)
+    return children
+
+
+def get_ancestors(role_pks):
+    return set(RoleClosure.objects.filter(descendant__in=role_pks)
+               .values_list('ancestor', flat=True))
+
+
+def get_edges(instance, reverse, pk_set):
+    """
+    return the (parent, child) role pks nesting through an m2m change of role perms
+    """
+    Role = get_role_model()
+    if reverse:  # instance is a permission, pk_set are roles
+        child = Role.objects.filter(delegate=instance).values_list('pk', flat=True).first()
+        return [] if child is None else [(parent, child) for parent in pk_set]
+    children = Role.objects.filter(delegate__in=pk_set).values_list('pk', flat=True)
+    return [(instance.pk, child) for child in children]
+
+
+def check_cycles(edges):
+    q = Q()
+    for parent, child in edges:
+        if parent == child:
+            raise RoleCycleError('a role cannot include itself.')
+        q |= Q(ancestor=child, descendant=parent)
+    if edges and RoleClosure.objects.filter(q).exists():
+        raise RoleCycleError('including the role would create a cycle.')
+
+
+def check_tenants(edges):
+    """
+    on a tenant scoped role model, a role includes the roles of its tenant and shared ones
+    only, a shared role shared ones only; so a change of a tenant's roles leaves the role
+    index of the other tenants valid (see rolez.generation.bump_generation)
+    """
+    Role = get_role_model()
+    if not edges or not issubclass(Role, AbstractTenantRole):
+        return
+    pks = {pk for edge in edges for pk in edge}
+    tenants = dict(Role.objects.filter(pk__in=pks).values_list('pk', 'tenant'))
+    for parent, child in edges:
+        if tenants[child] and tenants[child] != tenants[parent]:
+            raise RoleTenantError('a role cannot include a role of another tenant.')
+
+
+def add_edges(edges):
+    """
+    extend the closure for new edges; every ancestor of a parent (and the parent) now reaches
+    every descendant of the child (and the child)
+    """
+    if not edges:
+        return
+    parents = {parent for parent, _ in edges}
+    children = {child for _, child in edges}
+
+    ancestors = defaultdict(dict)
+    for parent in parents:
+        ancestors[parent][parent] = 0
+    for ancestor, descendant, depth in RoleClosure.objects.filter(descendant__in=parents) \
+            .values_list('ancestor', 'descendant', 'depth'):
+        ancestors[descendant][ancestor] = depth
+
+    descendants = defaultdict(dict)
+    for child in children:
+        descendants[child][child] = 0
+    for ancestor, descendant, depth in RoleClosure.objects.filter(ancestor__in=children) \
+            .values_list('ancestor', 'descendant', 'depth'):
+        descendants[ancestor][descendant] = depth
+
+    pairs = {}
+    for parent, child in edges:
+        for ancestor, up in ancestors[parent].items():
+            for descendant, down in descendants[child].items():
+                depth = up + 1 + down
+                if pairs.get((ancestor, descendant), depth) >= depth:
+                    pairs[(ancestor, descendant)] = depth
+
+    existing = RoleClosure.objects.filter(ancestor__in={a for a, _ in pairs},
+                                          descendant__in={d for _, d in pairs})
+    for pk, ancestor, descendant, depth in existing.values_list(
+            'pk', 'ancestor', 'descendant', 'depth'):
+        new_depth = pairs.pop((ancestor, descendant), None)
+        if new_depth is not None and new_depth < depth:  # found a shorter path
+            RoleClosure.objects.filter(pk=pk).update(depth=new_depth)
+    RoleClosure.objects.bulk_create([
+        RoleClosure(ancestor_id=ancestor, descendant_id=descendant, depth=depth)
+        for (ancestor, descendant), depth in pairs.items()])
+
+
+def rebuild_closure(role_pks=None):
+    """
+    recompute the closure rows of the given ancestors from the role perms; all when None
+    """
+    children = _get_children()
+    if role_pks is None:
+        RoleClosure.objects.all().delete()
+        role_pks = list(children)
+    else:
+        RoleClosure.objects.filter(ancestor__in=role_pks).delete()
+
+    rows = []
+    for root in role_pks:
+        depths = {root: 0}
+        queue = deque([root])
+        while queue:  # breadth first, so depth is the shortest path
+            current = queue.popleft()
+            for child in children[current]:
+                if child not in depths:
+                    depths[child] = depths[current] + 1
+                    queue.append(child)
+        rows.extend(RoleClosure(ancestor_id=root, descendant_id=descendant, depth=depth)
+                    for descendant, depth in depths.items() if descendant != root)
+    RoleClosure.objects.bulk_create(rows)
+
+
+def remove_edges(parents):
+    """
+    recompute the closure after nested roles were removed from parents
+    """
+    parents = set(parents)
+    if not parents:
+        return
+    rebuild_closure(parents | get_ancestors(parents))
@@ -0,0 +1,60 @@
+from django.contrib.auth.context_processors import PermWrapper, PermLookupDict
+from django.utils.functional import cached_property
+
+
+class RolePermLookupDict(PermLookupDict):
+    def __init__(self, wrapper, app_label):
+        super().__init__(wrapper.user, app_label)
+        self.wrapper = wrapper
+
+    def __repr__(self):
+        return str(self.wrapper.perms)
+
+    def __getitem__(self, perm_name):
+        return self.wrapper.has_perm('%s.%s' % (self.app_label, perm_name))
+
+    def __bool__(self):
+        return self.wrapper.has_module_perms(self.app_label)
+
+
+class RolePermWrapper(PermWrapper):
+    """
+    like django's PermWrapper, but loads the role expanded perms of the user once and answers
+    every {{ perms.app_label.codename }} of the render from them
+    """
+    def __getitem__(self, app_label):
+        return RolePermLookupDict(self, app_label)
+
+    @cached_property
+    def perms(self):
+        if hasattr(self.user, 'get_all_role_perms'):
+            return frozenset(self.user.get_all_role_perms())
+        return frozenset(self.user.get_all_permissions())
+
+    def has_perm(self, perm):
+        if self.user.is_active and self.user.is_superuser:
+            return True
+        return perm in self.perms
+
+    def has_module_perms(self, app_label):
+        if self.user.is_active and self.user.is_superuser:
+            return True
+        for perm in self.perms:
+            if perm[:perm.index('.')] == app_label:
+                return True
+        return False
+
+
+def role_perms(request):
+    """
+    replaces the perms of django.contrib.auth.context_processors.auth; list it after that one
+    """
+    if hasattr(request, 'user'):
+        user = request.user
+    else:
+        from django.contrib.auth.models import AnonymousUser
+        user = AnonymousUser()
+
+    return {
+        'perms': RolePermWrapper(user),
+    }
@@ -0,0 +1,129 @@
+import csv
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+
+from rolez.models import AbstractTenantRole
+from rolez.util import get_role_model, get_role_index, has_backend
+
+PermissionRow = namedtuple('PermissionRow', 'user username permission source role')
+
+FIELDS = PermissionRow._fields
+
+# lookups from a role to its perms, directly and through the roles nested in it
+_ROLE_PERM_PATHS = ('perms__', 'descendant_links__descendant__perms__')
+
+
+def _get_sources():
+    """
+    yield (source, through model, user field, path to the perms, path to the role or None)
+    """
+    UserModel = get_user_model()
+    user_perms = UserModel._meta.get_field('user_permissions')
+    groups = UserModel._meta.get_field('groups')
+
+    user_perm_path = user_perms.m2m_reverse_field_name() + '__'
+    group_perm_path = groups.m2m_reverse_field_name() + '__permissions__'
+
+    yield ('user', user_perms.remote_field.through, user_perms.m2m_field_name(),
+           user_perm_path, None)
+    yield ('group', groups.remote_field.through, groups.m2m_field_name(),
+           group_perm_path, None)
+    for path in _ROLE_PERM_PATHS:
+        yield ('user_role', user_perms.remote_field.through, user_perms.m2m_field_name(),
+               user_perm_path + 'role__' + path, user_perm_path + 'role__')
+        yield ('group_role', groups.remote_field.through, groups.m2m_field_name(),
+               group_perm_path + 'role__' + path, group_perm_path + 'role__')
+
+    try:
+        roles = UserModel._meta.get_field('roles')
+    except FieldDoesNotExist:
+        return
+    for path in _ROLE_PERM_PATHS:
+        yield ('roles', roles.remote_field.through, roles.m2m_field_name(),
+               roles.m2m_reverse_field_name() + '__' + path,
+               roles.m2m_reverse_field_name() + '__')
+
+
+def _get_default_roles():
+    """
+    return {name: perms (the delegate too)} of the default roles of authenticated users, when
+    RoleDefaultBackend is configured; the shared roles on a tenant scoped role model
+    """
+    names = getattr(settings, 'ROLE_AUTHENTICATED_ROLES', ())
+    if not names or not has_backend('RoleDefaultBackend'):
+        return {}
+    roles = get_role_model().objects.filter(name__in=names)
+    tenant = None
+    if issubclass(roles.model, AbstractTenantRole):
+        roles, tenant = roles.filter(tenant=''), ''
+    role_index = get_role_index(tenant)
+    default_roles = {}
+    for name, app_label, codename in roles.values_list(
+            'name', 'delegate__content_type__app_label', 'delegate__codename'):
+        delegate = '%s.%s' % (app_label, codename)
+        default_roles[name] = {delegate} | role_index.get(delegate, set())
+    return default_roles
+
+
+def _iter_default_role_rows(users, chunk_size):
+    # a row per perm of each default role, for every active user; none are stored per user
+    default_roles = _get_default_roles()
+    if not default_roles:
+        return
+    UserModel = get_user_model()
+    rows = UserModel._default_manager.filter(is_active=True)
+    if users is not None:
+        rows = rows.filter(pk__in=users.values('pk'))
+    for pk, username in rows.values_list('pk', UserModel.USERNAME_FIELD).iterator(
+            chunk_size=chunk_size):
+        for name, perms in sorted(default_roles.items()):
+            for perm in sorted(perms):
+                yield PermissionRow(pk, username, perm, 'default_role', name)
+
+
+def iter_effective_permissions(users=None, chunk_size=2000, only_active=True):
+    """
+    stream a PermissionRow for every effective permission of every user (or of the users
+    queryset), with the source it was granted through and the role, if any, it was granted by;
+    one set based query per source, iterated in chunks, so memory does not grow with users.
+    inactive users have none, as the backends deny them all, unless only_active is False.
+    the perms of the default roles (see rolez.backend.RoleDefaultBackend) are rows of source
+    'default_role' of every active user
+    """
+    username_field = get_user_model().USERNAME_FIELD
+    for source, through, user_field, perm_path, role_path in _get_sources():
+        rows = through.objects.filter(**{perm_path + 'isnull': False})
+        if users is not None:
+            rows = rows.filter(**{user_field + '__in': users.values('pk')})
+        if only_active:
+            rows = rows.filter(**{user_field + '__is_active': True})
+        columns = [user_field, user_field + '__' + username_field,
+                   perm_path + 'content_type__app_label', perm_path + 'codename']
+        if role_path is not None:
+            columns.append(role_path + 'name')
+        for row in rows.values_list(*columns).iterator(chunk_size=chunk_size):
+            yield PermissionRow(row[0], row[1], '%s.%s' % (row[2], row[3]), source,
+                                row[4] if role_path is not None else None)
+    yield from _iter_default_role_rows(users, chunk_size)
+
+
+def write_csv(rows, stream):
+    writer = csv.writer(stream)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(row)
+
+
+def write_jsonl(rows, stream):
+    for row in rows:
+        stream.write(json.dumps(row._asdict()) + '\n')
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+}
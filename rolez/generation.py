@@ -0,0 +1,254 @@
+import itertools
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, IntegrityError, transaction
+from django.db.models import F
+
+from rolez.models import RoleGeneration
+
+GENERATION_KEY = 'rolez:generation'
+OBJ_GENERATION_KEY = 'rolez:obj_generation'
+CHANGED_KEY = 'rolez:changed:%s'  # the tenant a generation changed the roles of
+
+_MAX_CHANGES = 100  # generations looked at to clear by tenant; more clear all
+_CHANGED_TIMEOUT = 24 * 60 * 60
+
+_callbacks = []
+
+
+class _State(object):
+    seen = None  # the generation the local caches were built for
+    checked_at = None  # monotonic time of the last comparison; None forces the next one
+
+
+_state = _State()
+
+
+def _get_cache():
+    return caches[getattr(settings, 'ROLE_CACHE', 'default')]
+
+
+def _use_database():
+    return getattr(settings, 'ROLE_GENERATION_STORE', 'cache') == 'database'
+
+
+def _seed():
+    # a lost key must not restart from a number an old snapshot may already carry
+    return int(time.time() * 1000)
+
+
+def _get_db_generation():
+    using = router.db_for_write(RoleGeneration)  # a replica may lag behind
+    generation = RoleGeneration.objects.using(using).values_list('value', flat=True).first()
+    if generation is None:
+        try:
+            with transaction.atomic(using=using):
+                RoleGeneration.objects.using(using).create(pk=1, value=_seed())
+        except IntegrityError:  # created concurrently
+            pass
+        generation = RoleGeneration.objects.using(using).values_list('value', flat=True).first()
+    return generation
+
+
+def get_generation():
+    """
+    Return the current role graph generation; it changes whenever roles, role perms or
+    role assignments change. Kept in the cache (settings.ROLE_CACHE), or in the database
+    when settings.ROLE_GENERATION_STORE is 'database', so all nodes share it; a cache local to
+    the process does not (see rolez.checks).
+    """
+    if _use_database():
+        return _get_db_generation()
+    cache = _get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _seed(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation(tenant=None):
+    """
+    move to a new generation; with tenant given, when only the roles of that tenant changed
+    (see rolez.models.AbstractTenantRole), the local caches drop that tenant's entries and the
+    ones across tenants only, here and on the other nodes
+    """
+    if _use_database():
+        using = router.db_for_write(RoleGeneration)
+        if not RoleGeneration.objects.using(using).update(value=F('value') + 1):
+            _get_db_generation()  # first bump; seeding is a change already
+        generation = _get_db_generation()
+    else:
+        cache = _get_cache()
+        try:
+            generation = cache.incr(GENERATION_KEY)
+        except ValueError:  # key missing
+            cache.add(GENERATION_KEY, _seed(), None)
+            generation = cache.get(GENERATION_KEY)
+        if tenant is not None:
+            cache.set(CHANGED_KEY % generation, tenant, _CHANGED_TIMEOUT)
+    # this node knows right away; the others on their next check. no generation with a
+    # cache that keeps nothing (see rolez.checks)
+    if generation is None:
+        tenants = None
+    elif tenant is not None and _state.seen == generation - 1 and not _use_database():
+        tenants = {tenant}
+    else:
+        tenants = _get_changed_tenants(_state.seen, generation)
+    _clear_local_caches(generation, tenants)
+    return generation
+
+
+def bump_generation_on_commit(tenant=None, using=None):
+    """
+    bump_generation once the transaction of a role change (on the using database) commits,
+    right away outside of one; bumped before, another node or thread could rebuild its caches
+    from the rows not changed yet and keep them for the new generation
+    """
+    transaction.on_commit(lambda: bump_generation(tenant), using=using)
+
+
+def _get_changed_tenants(seen, generation):
+    """
+    return the tenants the generations after seen, up to generation, changed; None if one
+    of them changed more than a tenant, or is not known
+    """
+    if (seen is None or generation is None or _use_database()
+            or not 0 < generation - seen <= _MAX_CHANGES):
+        return None
+    keys = [CHANGED_KEY % changed for changed in range(seen + 1, generation + 1)]
+    changes = _get_cache().get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    return set(changes.values())
+
+
+def bump_obj_generation(**kwargs):
+    """
+    invalidate the shared object check results (see rolez.cache); called on object perm
+    (guardian) changes, which do not touch the role graph. always kept in the cache.
+    call it after assigning object perms in bulk, which sends no signals; guardian's
+    assign_perm with a queryset of objects, or a queryset or list of users or groups:
+
+        assign_perm('blog.change_entry', editors, entry)
+        bump_obj_generation()
+    """
+    cache = _get_cache()
+    try:
+        return cache.incr(OBJ_GENERATION_KEY)
+    except ValueError:  # key missing
+        cache.add(OBJ_GENERATION_KEY, _seed(), None)
+        return cache.get(OBJ_GENERATION_KEY)
+
+
+def register_local_cache(clear):
+    """
+    register a callable dropping a process local cache of role data; it is called whenever
+    the role graph generation changes, on this node or another, with the set of tenants
+    whose roles changed, or None for all
+    """
+    _callbacks.append(clear)
+    return clear
+
+
+def _clear_local_caches(generation, tenants=None):
+    # cleared before the generation is marked seen; another thread checking meanwhile clears
+    # once more rather than reading the old data
+    for clear in _callbacks:
+        clear(tenants)
+    _state.seen = generation
+    _state.checked_at = time.monotonic()
+
+
+def check_generation():
+    """
+    compare the shared generation with the one the local caches were built for and drop them
+    if it moved; settings.ROLE_GENERATION_CHECK_INTERVAL is the seconds between comparisons,
+    1 by default, None for once per request, and 0 for every call. changes made by this
+    process are seen right away (see bump_generation)
+    """
+    interval = getattr(settings, 'ROLE_GENERATION_CHECK_INTERVAL', 1)
+    checked_at = _state.checked_at
+    if checked_at is not None:
+        if interval is None:
+            return _state.seen
+        if interval and time.monotonic() - checked_at < interval:
+            return _state.seen
+    generation = get_generation()
+    if generation != _state.seen:
+        _clear_local_caches(generation, _get_changed_tenants(_state.seen, generation))
+    else:
+        _state.checked_at = time.monotonic()
+    return generation
+
+
+def expire_generation_check(**kwargs):
+    # with a check per request, a new request compares once more
+    _state.checked_at = None
+
+
+_epochs = itertools.count()
+
+_TenantKey = namedtuple('_TenantKey', 'tenant key')
+
+
+class LocalCache(object):
+    """
+    process local (L1) cache of role data, valid for one role graph generation; needs a
+    generation store shared by all processes (see rolez.checks). safe to share between
+    threads: readers take no locks, the data is an immutable snapshot replaced as a whole on
+    set and clear; a missing value is built by one thread while the others wait for it (see
+    get_or_build). entries of a tenant are kept when the roles of another change
+    """
+    def __init__(self):
+        self._data = {}
+        self._epoch = next(_epochs)
+        self._lock = threading.RLock()  # one build at a time; a build may need another key
+        self._publish_lock = threading.Lock()  # never held during a build
+        register_local_cache(self.clear)
+
+    def get(self, key, default=None, tenant=None):
+        check_generation()
+        if tenant is not None:
+            key = _TenantKey(tenant, key)
+        return self._data.get(key, default)
+
+    def set(self, key, value, epoch=None, tenant=None):
+        """
+        publish value; dropped if epoch is given and the cache was cleared since, as it may
+        have been built from old data
+        """
+        if tenant is not None:
+            key = _TenantKey(tenant, key)
+        with self._publish_lock:  # a clear cannot come between the check and the publish
+            if epoch is not None and epoch != self._epoch:
+                return
+            data = dict(self._data)
+            data[key] = value
+            self._data = data
+
+    def get_or_build(self, key, build, tenant=None):
+        value = self.get(key, tenant=tenant)
+        if value is None:
+            with self._lock:
+                value = self._data.get(key if tenant is None else _TenantKey(tenant, key))
+                if value is None:  # not built while waiting
+                    epoch = self._epoch
+                    value = build()
+                    self.set(key, value, epoch, tenant)
+        return value
+
+    def clear(self, tenants=None):
+        # not the build lock; a reader noticing a new generation must not wait for a build
+        with self._publish_lock:
+            self._epoch = next(_epochs)
+            if tenants is None:
+                self._data = {}
+            else:
+                # the entries of the other tenants stay; the ones across tenants go
+                self._data = {key: value for key, value in self._data.items()
+                              if isinstance(key, _TenantKey) and key.tenant not in tenants}
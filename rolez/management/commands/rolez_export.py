@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from rolez.export import iter_effective_permissions, WRITERS
+
+
+class Command(BaseCommand):
+    help = 'Stream the effective permissions of all users, with their source and role.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+        parser.add_argument('--output', help='file to write to; stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--include-inactive', action='store_true',
+                            help='also the grants of inactive users, which are not effective')
+
+    def handle(self, *args, **options):
+        rows = iter_effective_permissions(chunk_size=options['chunk_size'],
+                                          only_active=not options['include_inactive'])
+        write = WRITERS[options['format']]
+        if options['output']:
+            with open(options['output'], 'w', newline='') as stream:
+                write(rows, stream)
+        else:
+            write(rows, self.stdout)
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rolez.warm import warm
+
+
+class Command(BaseCommand):
+    help = 'Precompute the shared rolez permission entries of the most recently active users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int,
+                            default=getattr(settings, 'ROLE_WARM_USERS', 1000))
+        parser.add_argument('--seconds', type=float,
+                            default=getattr(settings, 'ROLE_WARM_SECONDS', 30))
+        parser.add_argument('--max-bytes', type=int,
+                            default=getattr(settings, 'ROLE_WARM_MAX_BYTES', None))
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        stats = warm(users=options['users'], seconds=options['seconds'],
+                     max_bytes=options['max_bytes'], batch_size=options['batch_size'])
+        self.stdout.write('warmed %(users)s users, %(bytes)s bytes' % stats
+                          + ('' if stats['complete'] else ' (stopped at a limit)'))
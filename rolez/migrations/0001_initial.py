@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0009_alter_user_last_name_max_length'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        migrations.swappable_dependency(settings.ROLE_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleAssignment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_pk', models.CharField(max_length=255)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='role_assignments', to='auth.Group')),
+                ('role', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to=settings.ROLE_MODEL)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='role_assignments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('role', 'user', 'group', 'content_type', 'object_pk')},
+                'index_together': {('content_type', 'object_pk'), ('user', 'content_type'), ('group', 'content_type')},
+            },
+        ),
+    ]
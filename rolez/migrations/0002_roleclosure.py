@@ -0,0 +1,57 @@
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_closure(apps, schema_editor):
+    # roles may already include delegates of other roles; these become nested roles
+    Role = apps.get_model(settings.ROLE_MODEL)
+    RoleClosure = apps.get_model('rolez', 'RoleClosure')
+
+    delegates = dict(Role.objects.values_list('delegate', 'pk'))
+    children = defaultdict(set)
+    for role, perm in Role.perms.through.objects.values_list(
+            Role.perms.field.m2m_field_name(), Role.perms.field.m2m_reverse_field_name()):
+        if perm in delegates:
+            children[role].add(delegates[perm])
+
+    rows = []
+    for root in list(children):
+        depths = {root: 0}
+        queue = deque([root])
+        while queue:
+            current = queue.popleft()
+            for child in children[current]:
+                if child not in depths:
+                    depths[child] = depths[current] + 1
+                    queue.append(child)
+        rows.extend(RoleClosure(ancestor_id=root, descendant_id=descendant, depth=depth)
+                    for descendant, depth in depths.items() if descendant != root)
+    RoleClosure.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.ROLE_MODEL),
+        ('rolez', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to=settings.ROLE_MODEL)),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to=settings.ROLE_MODEL)),
+            ],
+            options={
+                'unique_together': {('ancestor', 'descendant')},
+                'index_together': {('descendant', 'ancestor')},
+            },
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
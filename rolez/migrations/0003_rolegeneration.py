@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rolez', '0002_roleclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoleGeneration',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rolez', '0003_rolegeneration'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='roleassignment',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='roleassignment',
+            constraint=models.CheckConstraint(
+                check=models.Q(user__isnull=False, group__isnull=True)
+                | models.Q(user__isnull=True, group__isnull=False),
+                name='rolez_roleassignment_user_or_group'),
+        ),
+        migrations.AddConstraint(
+            model_name='roleassignment',
+            constraint=models.UniqueConstraint(
+                fields=('role', 'user', 'content_type', 'object_pk'),
+                condition=models.Q(user__isnull=False), name='rolez_roleassignment_unique_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='roleassignment',
+            constraint=models.UniqueConstraint(
+                fields=('role', 'group', 'content_type', 'object_pk'),
+                condition=models.Q(group__isnull=False),
+                name='rolez_roleassignment_unique_group'),
+        ),
+    ]
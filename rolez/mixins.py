@@ -1,15 +1,12 @@
-from django.conf import settings
-from django.contrib.auth.models import Permission
+from rolez.util import clear_cache, get_cache_key, get_all_perms, get_role_index, check_lazily, \
+    get_tenant, has_backend
+from rolez.budget import guarded
+from rolez.cache import get_or_build_shared_perms, get_or_build_shared_obj_perm, MIXIN_PERMS
+from rolez.scope import has_scoped_role_perm
+from rolez.tracing import note, step, traced
 
-from rolez.util import clear_cache, get_cache_key, str_to_perm, get_perms_from_delegate, \
-    perms_to_str, get_delegates
 
-
-def _has_backend(name):
-    for backend in settings.AUTHENTICATION_BACKENDS:
-        if backend.endswith(name):
-            return True
-    return False
+_has_backend = has_backend  # the old name
 
 
 class UserRoleMixin(object):
@@ -18,61 +15,94 @@ class UserRoleMixin(object):
 
     def _get_role_perms(self, obj, from_name):
         super_ = getattr(super(), 'get_%s_permissions' % from_name)
-        if (obj is None and _has_backend('RoleModelBackend')
-                or obj is not None and _has_backend('RoleObjectBackend')):
+        if (obj is None and has_backend('RoleModelBackend')
+                or obj is not None and has_backend('RoleObjectBackend')):
             return super_(obj)
 
         cache_name = '_%s_role_perm_cache' % from_name
         if hasattr(self, cache_name):
+            note('cache hit', cache=cache_name)
             return getattr(self, cache_name)
 
-        if self.is_superuser:
-            perms_role_added = perms_to_str(Permission.objects.all())
+        if self.is_superuser and self.is_active:
+            perms_role_added = set(get_all_perms())
         else:
-            perms = super_(obj)
-            perms_role_added = set(perms)
-            app_name, _ = settings.ROLE_MODEL.split('.')
-            for perm in perms:
-                if perm[:perm.index('.')] == app_name:
-                    perm = str_to_perm(perm)
-                    if hasattr(perm, 'role'):
-                        perms_role_added.update(get_perms_from_delegate(perm))
-                    # todo: this will make n trips to the db
+            def build():
+                perms = super_(obj)
+                perms_role_added = set(perms)
+                role_index = get_role_index(get_tenant(self))  # shared by the process threads
+                for perm in perms:
+                    perms_role_added.update(role_index.get(perm, ()))
+                return perms_role_added
+            # the shared entries are of active users who are not superusers; one deactivated
+            # or demoted since must not read them
+            if obj is None and from_name == 'all' and self.is_active:
+                perms_role_added = set(get_or_build_shared_perms(self, MIXIN_PERMS, build))
+            else:
+                perms_role_added = build()
         setattr(self, cache_name, perms_role_added)
         return perms_role_added
 
     def get_group_role_perms(self, obj=None):
         return self._get_role_perms(obj, 'group')
 
+    @guarded('get_all_permissions')
     def get_all_role_perms(self, obj=None):
         return self._get_role_perms(obj, 'all')
 
+    @traced
+    @guarded('has_perm')
     def has_role_perm(self, perm, obj=None):
         if super().has_perm(perm, obj):
             # like django, this can only refer to its super, not get_(group|all)_permissions
             # directly bc a backend is not required to implement them all
             return True
 
-        if obj is None and not _has_backend('RoleModelBackend'):
+        if obj is None and not has_backend('RoleModelBackend'):
+            if not hasattr(self, '_all_role_perm_cache'):
+                granted = check_lazily(self, '_all_role_perm_checked', perm,
+                                       lambda: self._has_expanded_perm(perm))
+                if granted is not None:
+                    return granted
             return perm in self.get_all_role_perms()
 
-        if obj is not None and not _has_backend('RoleObjectBackend'):
+        if obj is not None and not has_backend('RoleObjectBackend'):
             if not hasattr(self, '_role_obj_cache'):
                 self._role_obj_cache = {}
 
             key = get_cache_key(obj, perm)
             if key in self._role_obj_cache:
+                note('cache hit', cache='_role_obj_cache')
                 return self._role_obj_cache[key]
 
-            # this should be more performant than RoleObjectBackend since it runs when super fails
-            # in the other, they both always run
-            self._role_obj_cache[key] = False
-            perm = str_to_perm(perm)
-            if not hasattr(perm, 'role'):  # not delegate
-                for delegate in get_delegates(perm):
-                    if super().has_perm(delegate, obj):
-                        self._role_obj_cache[key] = True
-                        return True
+            self._role_obj_cache[key] = get_or_build_shared_obj_perm(
+                self, perm, obj, lambda: self._has_role_obj_perm(perm, obj))
+            return self._role_obj_cache[key]
+        return False
+
+    def _has_expanded_perm(self, perm):
+        # perm in one of the roles held, without building the union of their perms
+        role_index = get_role_index(get_tenant(self))
+        return any(perm in role_index.get(held, ()) for held in super().get_all_permissions())
+
+    def _has_role_obj_perm(self, perm, obj):
+        # this should be more performant than RoleObjectBackend since it runs when super fails
+        # in the other, they both always run
+        if not has_backend('RoleScopeBackend'):
+            with step('scoped roles'):
+                scoped = has_scoped_role_perm(self, perm, obj)
+            if scoped:
+                return True
+
+        role_index = get_role_index(get_tenant(self))  # no queries per delegate
+        if perm not in role_index:  # not delegate
+            for delegate, perms in role_index.items():
+                if perm not in perms:
+                    continue
+                with step('delegate', perm=delegate):
+                    granted = super().has_perm(delegate, obj)
+                if granted:
+                    return True
         return False
 
 # 	def has_module_perms(self, user_obj, app_label):
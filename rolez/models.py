@@ -1,7 +1,12 @@
 import re
-from django.contrib.auth.models import Permission
+from django.conf import settings
+from django.contrib.auth.models import Permission, Group
+from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Q
+
 
 class AbstractRole(models.Model):
     name = models.CharField(
@@ -35,7 +40,172 @@ class AbstractRole(models.Model):
         super().delete(**kwargs)
         self.delegate.delete()
 
+    def set_permissions(self, perms):
+        """
+        make perms (strings like 'app_label.codename', Permission objects or pks) the perms of
+        the role with a bulk delete and insert of the changed rows only, instead of a signal per
+        row; sends rolez.signals.role_changed once, with the perm strings added and removed
+        """
+        # imported here; they need the concrete models
+        from rolez.closure import check_cycles, check_tenants, add_edges, remove_edges
+        from rolez.generation import bump_generation_on_commit
+        from rolez.signals import role_changed
+        from rolez.util import pin_primary
+
+        pks, names = set(), set()
+        for perm in perms:
+            if isinstance(perm, str):
+                name = tuple(perm.split('.', 1))
+                if len(name) != 2 or not all(name):
+                    raise ValueError("invalid perm %r, expected 'app_label.codename'." % perm)
+                names.add(name)
+            else:
+                pk = getattr(perm, 'pk', perm)
+                if not isinstance(pk, int) or isinstance(pk, bool):
+                    raise ValueError('invalid perm %r, expected a string, Permission or pk.'
+                                     % (perm,))
+                pks.add(pk)
+        if names:
+            q = Q()
+            for app_label, codename in names:
+                q |= Q(content_type__app_label=app_label, codename=codename)
+            found = Permission.objects.filter(q).values_list(
+                'pk', 'content_type__app_label', 'codename')
+            for pk, app_label, codename in found:
+                pks.add(pk)
+                names.discard((app_label, codename))
+            if names:
+                raise Permission.DoesNotExist(
+                    'unknown perms: %s' % ', '.join(sorted('.'.join(name) for name in names)))
+
+        field = type(self).perms.field
+        through = field.remote_field.through
+        role_name, perm_name = field.m2m_field_name(), field.m2m_reverse_field_name()
+        with transaction.atomic():
+            current = set(through.objects.filter(**{role_name: self})
+                          .values_list(perm_name, flat=True))
+            added, removed = pks - current, current - pks
+            if not added and not removed:
+                return set(), set()
+            strs = {pk: '%s.%s' % (app_label, codename) for pk, app_label, codename in
+                    Permission.objects.filter(pk__in=added | removed)
+                    .values_list('pk', 'content_type__app_label', 'codename')}
+            unknown = added - set(strs)
+            if unknown:
+                raise ValueError('unknown perm pks: %s' % ', '.join(map(str, sorted(unknown))))
+
+            Role = type(self)
+            added_roles = Role.objects.filter(delegate__in=added).values_list('pk', flat=True)
+            edges = [(self.pk, child) for child in added_roles]
+            check_cycles(edges)
+            check_tenants(edges)
+
+            if removed:
+                through.objects.filter(**{role_name: self, perm_name + '__in': removed}).delete()
+            through.objects.bulk_create([
+                through(**{role_name + '_id': self.pk, perm_name + '_id': pk}) for pk in added])
+
+            if removed and Role.objects.filter(delegate__in=removed).exists():
+                remove_edges([self.pk])  # recomputes what is left, incl. the added edges
+            else:
+                add_edges(edges)
+        added, removed = {strs[pk] for pk in added}, {strs[pk] for pk in removed}
+        bump_generation_on_commit(getattr(self, 'tenant', None) or None)
+        pin_primary()
+        role_changed.send(sender=Role, role=self, added=added, removed=removed)
+        return added, removed
+
     class Meta:
         abstract = True
 
 
+class AbstractTenantRole(AbstractRole):
+    """
+    an AbstractRole scoped by tenant, for a multi-tenant site:
+
+        class Role(AbstractTenantRole): ...
+
+    names are unique per tenant, delegates are namespaced by it, and the role index, default
+    roles and local cache invalidation are partitioned by it (see rolez.util.get_tenant)
+    """
+    # tenant and name fit in the 100 characters of a delegate codename
+    tenant = models.CharField(max_length=28, blank=True, default='', db_index=True)
+    name = models.CharField(max_length=60)
+
+    def codename(self):
+        codename = super().codename()
+        if not self.tenant:
+            return codename
+        # names lose their ':'s, so the last one ends the tenant; shared roles have none
+        return 'use_role_%s:%s' % (self.tenant, codename[len('use_role_'):])
+
+    def perm_name(self):
+        perm_name = super().perm_name()
+        return '%s of %s' % (perm_name, self.tenant) if self.tenant else perm_name
+
+    class Meta(AbstractRole.Meta):
+        abstract = True
+        unique_together = [('tenant', 'name')]
+
+
+class RoleAssignment(models.Model):
+    """
+    a role given to a user or a group on a scope object; also covers the objects related
+    to it through settings.ROLE_SCOPE_RELATIONS
+    """
+    role = models.ForeignKey(settings.ROLE_MODEL, on_delete=models.CASCADE,
+                             related_name='assignments')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
+                             on_delete=models.CASCADE, related_name='role_assignments')
+    group = models.ForeignKey(Group, null=True, blank=True, on_delete=models.CASCADE,
+                              related_name='role_assignments')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_pk = models.CharField(max_length=255)  # like guardian, to allow any pk type
+    scope = GenericForeignKey('content_type', 'object_pk')
+
+    def clean(self):
+        if (self.user_id is None) == (self.group_id is None):
+            raise ValidationError('a role is assigned to either a user or a group.')
+
+    class Meta:
+        index_together = [
+            ('content_type', 'object_pk'),
+            ('user', 'content_type'),
+            ('group', 'content_type'),
+        ]
+        # null user or group columns never collide in a unique index; one per principal
+        constraints = [
+            models.CheckConstraint(
+                check=Q(user__isnull=False, group__isnull=True)
+                | Q(user__isnull=True, group__isnull=False),
+                name='rolez_roleassignment_user_or_group'),
+            models.UniqueConstraint(
+                fields=['role', 'user', 'content_type', 'object_pk'],
+                condition=Q(user__isnull=False), name='rolez_roleassignment_unique_user'),
+            models.UniqueConstraint(
+                fields=['role', 'group', 'content_type', 'object_pk'],
+                condition=Q(group__isnull=False), name='rolez_roleassignment_unique_group'),
+        ]
+
+
+class RoleClosure(models.Model):
+    """
+    transitive closure of nested roles; a row for every role (descendant) whose delegate is
+    among the perms of another (ancestor), directly (depth 1) or through other roles
+    """
+    ancestor = models.ForeignKey(settings.ROLE_MODEL, on_delete=models.CASCADE,
+                                 related_name='descendant_links')
+    descendant = models.ForeignKey(settings.ROLE_MODEL, on_delete=models.CASCADE,
+                                   related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [('ancestor', 'descendant')]
+        index_together = [('descendant', 'ancestor')]
+
+
+class RoleGeneration(models.Model):
+    """
+    single row counter of role graph changes, when settings.ROLE_GENERATION_STORE is 'database'
+    """
+    value = models.BigIntegerField()
@@ -0,0 +1,173 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+from django.db.models.functions import Cast
+
+from rolez.export import iter_effective_permissions
+from rolez.mixins import UserRoleMixin
+from rolez.scope import filter_by_scoped_role_perm
+from rolez.util import get_perm_filter, get_roles_with_perm, get_read_db, get_cache_key, \
+    get_all_perms, get_default_perms, has_backend
+
+
+def get_granting_perms(perm):
+    """
+    return perm together with the delegates of the roles including it (nested ones too)
+    """
+    return Permission.objects.filter(Q(**get_perm_filter(perm))
+                                     | Q(role__in=get_roles_with_perm(perm)))
+
+
+def _get_guardian_perms(user_obj, perm, model, **lookup):
+    """
+    return the guardian user and group object permission querysets granting perm on objects
+    of model; None if guardian is not installed
+    """
+    if not apps.is_installed('guardian'):  # guardian is optional
+        return None
+    # generic object permissions only; direct foreign key ones are not looked at
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+
+    user_groups_field = get_user_model()._meta.get_field('groups')
+    groups = Group.objects.filter(**{user_groups_field.related_query_name(): user_obj})
+    lookup.update({
+        'content_type': ContentType.objects.get_for_model(model),
+        'permission__in': get_granting_perms(perm),
+    })
+    # not bound to a database; they may be subqueries of a queryset on another alias
+    return (UserObjectPermission.objects.filter(user=user_obj, **lookup),
+            GroupObjectPermission.objects.filter(group__in=groups, **lookup))
+
+
+def _get_guardian_pks(user_obj, perm, model, object_pks):
+    perms = _get_guardian_perms(user_obj, perm, model, object_pk__in=object_pks)
+    pks = set()
+    for object_perms in perms or ():
+        pks.update(object_perms.using(get_read_db()).values_list('object_pk', flat=True))
+    return pks
+
+
+def get_objects_with_role_perm(user_obj, perm, objects):
+    """
+    return the pks of the objects (instances of one model) user_obj has perm on, directly or
+    through a role; guardian object perms of the user and its groups, and scoped roles. takes
+    a fixed number of queries however many objects there are
+    """
+    objects = list(objects)
+    if not objects or not user_obj.is_active or user_obj.is_anonymous:
+        return set()
+    if user_obj.is_superuser:
+        return {obj.pk for obj in objects}
+
+    model = objects[0].__class__
+    pks = {str(obj.pk): obj.pk for obj in objects}  # guardian keeps pks as strings
+    granted = {pks[pk] for pk in _get_guardian_pks(user_obj, perm, model, list(pks))}
+    scoped = filter_by_scoped_role_perm(
+        user_obj, perm, model._default_manager.using(get_read_db()).filter(pk__in=pks.values()))
+    granted.update(scoped.values_list('pk', flat=True))
+    return granted
+
+
+def prefetch_role_obj_perms(user_obj, perms, objects):
+    """
+    resolve perms on all objects (instances of one model) at once, into the cache
+    has_prefetched_perms reads; a fixed number of queries per perm
+    """
+    objects = list(objects)
+    if not objects:
+        return
+    if not hasattr(user_obj, '_role_prefetch_cache'):
+        user_obj._role_prefetch_cache = {}
+    for perm in perms:
+        granted = get_objects_with_role_perm(user_obj, perm, objects)
+        for obj in objects:
+            user_obj._role_prefetch_cache[get_cache_key(obj, perm)] = obj.pk in granted
+
+
+def has_prefetched_perms(user_obj, perms, obj):
+    """
+    check perms on obj with the prefetched grants, falling back to user_obj.has_perm for the
+    ones not prefetched or not granted there, as other backends may still grant them
+    """
+    cache = getattr(user_obj, '_role_prefetch_cache', {})
+    for perm in perms:
+        if not cache.get(get_cache_key(obj, perm)) and not user_obj.has_perm(perm, obj):
+            return False
+    return True
+
+
+def filter_by_role_perm(user_obj, perm, queryset):
+    """
+    narrow queryset in sql to the objects user_obj has perm on; the same sources as
+    get_objects_with_role_perm. the queryset is sent to the rolez read database, with the
+    subqueries
+    """
+    if not user_obj.is_active or user_obj.is_anonymous:
+        return queryset.none()
+    if user_obj.is_superuser:
+        return queryset
+
+    model = queryset.model
+    scoped = filter_by_scoped_role_perm(user_obj, perm, model._default_manager.all())
+    q = Q(pk__in=scoped.values('pk'))
+    for object_perms in _get_guardian_perms(user_obj, perm, model) or ():
+        q |= Q(pk__in=object_perms.annotate(_object_pk=Cast('object_pk', model._meta.pk))
+               .values('_object_pk'))
+    return queryset.using(get_read_db()).filter(q)
+
+
+def prefetch_role_permissions(users):
+    """
+    compute the model level perms of users (instances) at once, and fill the perm caches of
+    each (those of django's ModelBackend, the rolez backends and UserRoleMixin; see
+    rolez.util.clear_cache), so that has_perm and get_all_role_perms on them do not query.
+    a query per permission source, however many users; returns the users as a list
+    """
+    users = list(users)
+    active = {user.pk: user for user in users if user.is_active and not user.is_anonymous}
+    if not active:
+        return users
+
+    sources = {pk: {'user': set(), 'group': set(), 'user_role': set(), 'group_role': set(),
+                    'roles': set(), 'default_role': set()} for pk in active}
+    UserModel = get_user_model()
+    for row in iter_effective_permissions(users=UserModel._default_manager.filter(pk__in=active)):
+        sources[row.user][row.source].add(row.permission)
+
+    with_roles_list = has_backend('RoleListModelBackend')
+    with_default_roles = has_backend('RoleDefaultBackend')
+    for pk, user in active.items():
+        perms = sources[pk]
+        # django model backend; a superuser has all
+        if user.is_superuser:
+            user._user_perm_cache = set(get_all_perms())
+            user._group_perm_cache = set(get_all_perms())
+        else:
+            user._user_perm_cache = perms['user']
+            user._group_perm_cache = perms['group']
+        user._perm_cache = user._user_perm_cache | user._group_perm_cache
+
+        # role model backend
+        user._user_role_model_cache = perms['user_role']
+        user._group_role_model_cache = perms['group_role']
+        user._role_model_cache = perms['user_role'] | perms['group_role']
+
+        # role list model backend
+        if hasattr(user, 'roles'):
+            user._roles_perm_cache = perms['roles']
+
+        # role mixin; the perms of the other backends with the roles expanded
+        if isinstance(user, UserRoleMixin):
+            if user.is_superuser:
+                user._all_role_perm_cache = set(get_all_perms())
+                user._group_role_perm_cache = set(get_all_perms())
+            else:
+                user._all_role_perm_cache = user._perm_cache | user._role_model_cache
+                if with_roles_list:
+                    user._all_role_perm_cache |= perms['roles']
+                if with_default_roles:  # the same for all users, computed once
+                    user._all_role_perm_cache |= get_default_perms(user)
+                user._group_role_perm_cache = perms['group'] | perms['group_role']
+    return users
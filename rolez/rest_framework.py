@@ -0,0 +1,83 @@
+from django.http import Http404
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.permissions import DjangoObjectPermissions, SAFE_METHODS
+
+from rolez.prefetch import prefetch_role_obj_perms, has_prefetched_perms, filter_by_role_perm
+
+
+class RoleObjectPermissions(DjangoObjectPermissions):
+    """
+    DjangoObjectPermissions answering from the object perms prefetched for a page (see
+    RolePermissionsMixin); objects not prefetched are checked with user.has_perm. like
+    DjangoObjectPermissions, the model perms are required for every method, unless
+    object_perms_only is True: then for POST only, as roles may grant the others on some
+    objects alone, checked in has_object_permission
+    """
+    object_perms_only = False
+
+    def has_permission(self, request, view):
+        if not self.object_perms_only or request.method == 'POST':
+            return super().has_permission(request, view)
+        return bool(request.user and
+                    (request.user.is_authenticated or not self.authenticated_users_only))
+
+    def prefetch(self, request, view, objects, perms=None):
+        objects = list(objects)
+        if not objects:
+            return
+        if perms is None:
+            perms = self.get_required_object_permissions(request.method, objects[0].__class__)
+        prefetch_role_obj_perms(request.user, perms, objects)
+
+    def has_object_permission(self, request, view, obj):
+        # like DjangoObjectPermissions, with the perm checks going through the prefetch cache
+        model_cls = obj.__class__
+        user = request.user
+
+        perms = self.get_required_object_permissions(request.method, model_cls)
+        if not has_prefetched_perms(user, perms, obj):
+            # if the user does not have permissions we need to determine if they have read
+            # permissions to see 403, or not, and simply see a 404 response
+            if request.method in SAFE_METHODS:
+                raise Http404
+
+            read_perms = self.get_required_object_permissions('GET', model_cls)
+            if not has_prefetched_perms(user, read_perms, obj):
+                raise Http404
+            return False
+        return True
+
+
+class RoleObjectPermissionsFilter(BaseFilterBackend):
+    """
+    narrow list querysets in sql to the objects the user has the view perm on; directly,
+    through role delegates, or scoped roles
+    """
+    perm_format = '%(app_label)s.view_%(model_name)s'
+
+    def filter_queryset(self, request, queryset, view):
+        perm = self.perm_format % {
+            'app_label': queryset.model._meta.app_label,
+            'model_name': queryset.model._meta.model_name,
+        }
+        return filter_by_role_perm(request.user, perm, queryset)
+
+
+class RolePermissionsMixin(object):
+    """
+    GenericAPIView mixin prefetching the object perms of every page for RoleObjectPermissions,
+    so checking them per object, e.g. in a serializer, does not query; prefetch_perms
+    defaults to the perms required for the request method
+    """
+    prefetch_perms = None
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            self.prefetch_object_permissions(page)
+        return page
+
+    def prefetch_object_permissions(self, objects):
+        for permission in self.get_permissions():
+            if isinstance(permission, RoleObjectPermissions):
+                permission.prefetch(self.request, self, objects, self.prefetch_perms)
@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q, CharField
+from django.db.models.functions import Cast
+
+from rolez.models import RoleAssignment
+from rolez.util import get_perm_filter, get_roles_with_perm, get_read_db
+
+
+def _get_parent_relations(model):
+    relations = getattr(settings, 'ROLE_SCOPE_RELATIONS', {})
+    return relations.get(model._meta.label_lower, ())
+
+
+def _resolve_path(model, path):
+    """
+    return the model the lookup path ends at and whether it may yield multiple rows
+    """
+    multi = False
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        multi = multi or field.many_to_many or field.one_to_many
+        model = field.related_model
+    return model, multi
+
+
+def get_scope_relations(model):
+    """
+    return [(parent model, lookup path from model, multi valued)] for every scope the objects
+    of model inherit role assignments from; settings.ROLE_SCOPE_RELATIONS maps a model label
+    to lookup paths, e.g. {'blog.entry': ['blog']}, and is followed transitively
+    """
+    relations = []
+    pending = [(model, '', False)]
+    seen = {model}
+    while pending:
+        current, prefix, multi = pending.pop()
+        for path in _get_parent_relations(current):
+            parent, parent_multi = _resolve_path(current, path)
+            full_path = prefix + path
+            relations.append((parent, full_path, multi or parent_multi))
+            if parent not in seen:
+                seen.add(parent)
+                pending.append((parent, full_path + '__', multi or parent_multi))
+    return relations
+
+
+def _role_perm_q(perm):
+    # assigned roles that include perm (also through nested roles), or whose delegate is perm
+    perm_filter = get_perm_filter(perm)
+    return (Q(role__in=get_roles_with_perm(perm))
+            | Q(**{'role__delegate__' + key: value for key, value in perm_filter.items()}))
+
+
+def get_user_assignments(user_obj, perm):
+    user_groups_field = get_user_model()._meta.get_field('groups')
+    groups = Group.objects.filter(**{user_groups_field.related_query_name(): user_obj})
+    return RoleAssignment.objects \
+        .filter(Q(user=user_obj) | Q(group__in=groups)) \
+        .filter(_role_perm_q(perm))
+
+
+def has_scoped_role_perm(user_obj, perm, obj):
+    """
+    check in a single query whether user_obj, or one of its groups, has a role with perm on
+    obj or on a scope obj inherits from; never for inactive or anonymous users
+    """
+    if not user_obj.is_active or user_obj.is_anonymous:
+        return False
+    model = obj.__class__
+    get_ctype = ContentType.objects.get_for_model  # cached by django
+    scopes = Q(content_type=get_ctype(model), object_pk=str(obj.pk))
+    for parent, path, _ in get_scope_relations(model):
+        parent_pks = model._default_manager.filter(pk=obj.pk) \
+            .annotate(_scope_pk=Cast(path, CharField())).values('_scope_pk')
+        scopes |= Q(content_type=get_ctype(parent), object_pk__in=parent_pks)
+    return get_user_assignments(user_obj, perm).using(get_read_db()).filter(scopes).exists()
+
+
+def _scope_pks(assignments, model):
+    return assignments.filter(content_type=ContentType.objects.get_for_model(model)) \
+        .annotate(_scope_pk=Cast('object_pk', model._meta.pk)).values('_scope_pk')
+
+
+def filter_by_scoped_role_perm(user_obj, perm, queryset):
+    """
+    narrow queryset in sql to the objects user_obj has a scoped role with perm on
+    """
+    if not user_obj.is_active or user_obj.is_anonymous:
+        return queryset.none()
+    model = queryset.model
+    assignments = get_user_assignments(user_obj, perm)
+    q = Q(pk__in=_scope_pks(assignments, model))
+    distinct = False
+    for parent, path, multi in get_scope_relations(model):
+        q |= Q(**{path + '__in': _scope_pks(assignments, parent)})
+        distinct = distinct or multi
+    queryset = queryset.filter(q)
+    return queryset.distinct() if distinct else queryset
+
+
+def assign_scoped_role(role, principal, obj):
+    """
+    give role to principal (user or group) on obj, and the objects inheriting from it
+    """
+    field = 'group' if isinstance(principal, Group) else 'user'
+    assignment, _ = RoleAssignment.objects.get_or_create(**{
+        'role': role,
+        field: principal,
+        'content_type': ContentType.objects.get_for_model(obj),
+        'object_pk': str(obj.pk),
+    })
+    return assignment
+
+
+def remove_scoped_role(role, principal, obj):
+    field = 'group' if isinstance(principal, Group) else 'user'
+    RoleAssignment.objects.filter(**{
+        'role': role,
+        field: principal,
+        'content_type': ContentType.objects.get_for_model(obj),
+        'object_pk': str(obj.pk),
+    }).delete()
@@ -0,0 +1,123 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import QuerySet, Q
+
+from rolez.generation import bump_generation_on_commit
+from rolez.signals import role_assignment_changed
+from rolez.util import clear_cache, get_perm_filter, get_roles_with_perm, pin_primary, \
+    get_default_perms, has_backend, perm_to_str
+
+
+def _get_relation(role, field):
+    """
+    return the through model, its user and target field names and the target pk of the given
+    user relation; user_permissions (delegates) or a roles m2m to the role model
+    """
+    m2m = get_user_model()._meta.get_field(field)
+    target = role.delegate if m2m.related_model is Permission else role
+    return (m2m.remote_field.through, m2m.m2m_field_name(), m2m.m2m_reverse_field_name(),
+            target.pk)
+
+
+def _split_users(users, chunk_size):
+    """
+    return chunks of pks, or a pk subquery, usable in an __in lookup, and the instances to
+    clear caches of
+    """
+    if isinstance(users, QuerySet):
+        return [users.values('pk')], []
+    users = list(users)  # iterated once; may be a generator
+    instances = [user for user in users if not isinstance(user, int)]
+    pks = list(dict.fromkeys(getattr(user, 'pk', user) for user in users))
+    return [pks[i:i + chunk_size] for i in range(0, len(pks), chunk_size)], instances
+
+
+def assign_role(role, users, field='user_permissions', chunk_size=500):
+    """
+    give role to many users (a queryset, instances or pks) in a query or two per chunk_size
+    users, by inserting the through rows directly; sends role_assignment_changed once
+    """
+    through, user_name, target_name, target_pk = _get_relation(role, field)
+    chunks, instances = _split_users(users, chunk_size)
+    new = []
+    with transaction.atomic():
+        for pks in chunks:
+            existing = through.objects.filter(**{target_name: target_pk, user_name + '__in': pks})
+            existing = set(existing.values_list(user_name, flat=True))
+            if isinstance(pks, QuerySet):
+                pks = pks.values_list('pk', flat=True)
+            new += [pk for pk in pks if pk not in existing]
+        # rows inserted by a concurrent assignment meanwhile are skipped
+        through.objects.bulk_create(
+            [through(**{user_name + '_id': pk, target_name + '_id': target_pk}) for pk in new],
+            batch_size=1000, ignore_conflicts=True)
+    _changed(role, new, instances, 'assign')
+    return len(new)
+
+
+def revoke_role(role, users, field='user_permissions', chunk_size=500):
+    """
+    take role from many users (a queryset, instances or pks) in two queries per chunk_size
+    users; sends role_assignment_changed once
+    """
+    through, user_name, target_name, target_pk = _get_relation(role, field)
+    chunks, instances = _split_users(users, chunk_size)
+    revoked = []
+    with transaction.atomic():
+        for pks in chunks:
+            rows = through.objects.filter(**{target_name: target_pk, user_name + '__in': pks})
+            revoked += rows.values_list(user_name, flat=True)
+            rows.delete()
+    _changed(role, revoked, instances, 'revoke')
+    return len(revoked)
+
+
+def _changed(role, user_pks, instances, action):
+    if not user_pks:
+        return
+    for user in instances:
+        clear_cache(user)
+    bump_generation_on_commit()
+    pin_primary()
+    role_assignment_changed.send(sender=role.__class__, role=role, user_pks=user_pks,
+                                 action=action)
+
+
+def get_users_with_role_perm(perm, with_superusers=False, only_active=True):
+    """
+    return a lazy queryset of the users holding perm directly, through a group, or through
+    a role (possibly nested) delegated to them or their groups, or in their roles list, or
+    all active users when a default role has it (the shared ones on a tenant scoped role
+    model; see rolez.util.get_default_perms); each path is an indexed subquery, so nothing is
+    loaded until iterated
+    """
+    UserModel = get_user_model()
+    roles = get_roles_with_perm(perm)
+    grants = Permission.objects.filter(Q(**get_perm_filter(perm)) | Q(role__in=roles))
+    groups = Group.objects.filter(permissions__in=grants)
+
+    q = Q(pk__in=UserModel.objects.filter(user_permissions__in=grants).values('pk')) \
+        | Q(pk__in=UserModel.objects.filter(groups__in=groups).values('pk'))
+    try:
+        UserModel._meta.get_field('roles')
+        q |= Q(pk__in=UserModel.objects.filter(roles__in=roles).values('pk'))
+    except FieldDoesNotExist:
+        pass
+    if with_superusers:
+        q |= Q(is_superuser=True)
+    if has_backend('RoleDefaultBackend'):
+        perm_str = perm if isinstance(perm, str) else perm_to_str(perm)
+        if perm_str in get_default_perms(UserModel(is_active=True)):
+            q |= Q(is_active=True)  # inactive users have no default roles
+
+    users = UserModel.objects.filter(q)
+    return users.filter(is_active=True) if only_active else users
+
+
+def iter_users_with_role_perm(perm, chunk_size=2000, **kwargs):
+    """
+    stream the users of get_users_with_role_perm without caching them in the queryset
+    """
+    return get_users_with_role_perm(perm, **kwargs).order_by('pk').iterator(chunk_size=chunk_size)
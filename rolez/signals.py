@@ -0,0 +1,114 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.signals import request_started
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import Signal
+
+from rolez.closure import get_edges, check_cycles, check_tenants, add_edges, remove_edges, \
+    get_ancestors
+from rolez.generation import bump_generation_on_commit, bump_obj_generation, \
+    expire_generation_check
+from rolez.models import RoleAssignment, AbstractTenantRole
+from rolez.util import get_role_model, pin_primary, unpin_primary
+
+# sent once per bulk assignment or revocation; args: role, user_pks, action ('assign'|'revoke')
+role_assignment_changed = Signal()
+
+# sent once per AbstractRole.set_permissions; args: role, added, removed (sets of perm strings)
+role_changed = Signal()
+
+
+def _get_tenant(instance):
+    # the tenant a change is limited to, the one of a tenant scoped role; None for all, also
+    # when the role moved to another tenant
+    if isinstance(instance, get_role_model()) and not getattr(instance, '_tenant_changed', False):
+        return getattr(instance, 'tenant', None) or None
+    return None
+
+
+def role_pre_save(sender, instance, **kwargs):
+    # a tenant scoped role moved to another tenant changes the roles of both
+    old = sender.objects.filter(pk=instance.pk).values_list('tenant', flat=True).first() \
+        if instance.pk is not None else None
+    instance._tenant_changed = old is not None and old != instance.tenant
+
+
+def role_graph_changed(sender, instance, using=None, **kwargs):
+    bump_generation_on_commit(_get_tenant(instance), using)
+    pin_primary()
+
+
+def role_graph_m2m_changed(sender, action, instance, using=None, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation_on_commit(_get_tenant(instance), using)
+        pin_primary()
+
+
+def sync_role_closure(sender, instance, action, reverse, pk_set, **kwargs):
+    # keep the nested role closure in sync
+    if action in ('pre_add', 'post_add', 'post_remove'):
+        edges = get_edges(instance, reverse, pk_set)
+        if action == 'pre_add':
+            check_cycles(edges)
+            check_tenants(edges)
+        elif action == 'post_add':
+            add_edges(edges)
+        elif edges:
+            remove_edges({parent for parent, _ in edges})
+    elif action == 'post_clear':
+        if reverse:  # closure not updated yet; still knows the parents
+            child = get_role_model().objects.filter(delegate=instance).values('pk')
+            remove_edges(get_ancestors(child))
+        else:
+            remove_edges([instance.pk])
+
+
+def role_pre_delete(sender, instance, **kwargs):
+    instance._closure_ancestors = get_ancestors([instance.pk])
+
+
+def role_post_delete(sender, instance, **kwargs):
+    remove_edges(getattr(instance, '_closure_ancestors', ()))
+
+
+def connect_signals():
+    Role = get_role_model()
+    UserModel = get_user_model()
+
+    post_save.connect(role_graph_changed, sender=Role, dispatch_uid='rolez_role_saved')
+    if issubclass(Role, AbstractTenantRole):
+        pre_save.connect(role_pre_save, sender=Role, dispatch_uid='rolez_role_pre_save')
+    post_delete.connect(role_graph_changed, sender=Role, dispatch_uid='rolez_role_deleted')
+    pre_delete.connect(role_pre_delete, sender=Role, dispatch_uid='rolez_closure_pre_delete')
+    post_delete.connect(role_post_delete, sender=Role, dispatch_uid='rolez_closure_post_delete')
+    m2m_changed.connect(sync_role_closure, sender=Role.perms.through,
+                        dispatch_uid='rolez_closure_perms')
+    post_save.connect(role_graph_changed, sender=RoleAssignment,
+                      dispatch_uid='rolez_assignment_saved')
+    post_delete.connect(role_graph_changed, sender=RoleAssignment,
+                        dispatch_uid='rolez_assignment_deleted')
+
+    request_started.connect(unpin_primary, dispatch_uid='rolez_unpin_primary')
+    request_started.connect(expire_generation_check, dispatch_uid='rolez_expire_generation')
+
+    # role perms and role (delegate) assignments, directly or through groups
+    for through in (Role.perms.through,
+                    UserModel.user_permissions.through,
+                    UserModel.groups.through,
+                    Group.permissions.through):
+        m2m_changed.connect(role_graph_m2m_changed, sender=through,
+                            dispatch_uid='rolez_m2m_%s' % through._meta.label_lower)
+
+    # object perms, for the shared object check results; guardian's generic models and the
+    # direct foreign key ones. bulk changes send no signals (see bump_obj_generation)
+    if apps.is_installed('guardian'):
+        from guardian.models import BaseObjectPermission
+        for model in apps.get_models():
+            if not issubclass(model, BaseObjectPermission):
+                continue
+            label = model._meta.label_lower
+            post_save.connect(bump_obj_generation, sender=model,
+                              dispatch_uid='rolez_obj_perm_saved_%s' % label)
+            post_delete.connect(bump_obj_generation, sender=model,
+                                dispatch_uid='rolez_obj_perm_deleted_%s' % label)
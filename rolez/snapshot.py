@@ -0,0 +1,99 @@
+import json
+
+from rolez.generation import get_generation
+
+SNAPSHOT_VERSION = 1
+
+
+class StaleSnapshot(ValueError):
+    pass
+
+
+def _get_effective_perms(user):
+    if hasattr(user, 'get_all_role_perms'):
+        return user.get_all_role_perms()
+    return user.get_all_permissions()
+
+
+def get_snapshot(user):
+    """
+    Export the effective (role expanded) model permissions of user as a compact dict that
+    can be pickled or dumped to json, e.g. to be sent with a background task. Loading it in
+    another process needs a generation store shared by both (see rolez.checks).
+    """
+    # read before computing perms; a change in between makes the snapshot stale, not wrong
+    generation = get_generation()
+    perms = {}
+    if user.is_active and not user.is_superuser:  # superusers need no perm list
+        for perm in _get_effective_perms(user):
+            app_label, codename = perm.split('.', 1)
+            perms.setdefault(app_label, []).append(codename)
+        for codenames in perms.values():
+            codenames.sort()
+    return {
+        'v': SNAPSHOT_VERSION,
+        'g': generation,
+        'pk': user.pk,
+        'active': user.is_active,
+        'super': user.is_superuser,
+        'perms': perms,
+    }
+
+
+class FrozenPrincipal(object):
+    """
+    read only stand-in for a user, rebuilt from a snapshot; answers model level permission
+    checks without touching the database
+    """
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, pk, perms, is_active=True, is_superuser=False, generation=None):
+        self.pk = pk
+        self.is_active = is_active
+        self.is_superuser = is_superuser
+        self.generation = generation
+        self._perms = frozenset(perms)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, check_generation=True):
+        if snapshot.get('v') != SNAPSHOT_VERSION:
+            raise ValueError('unsupported snapshot version: %r' % snapshot.get('v'))
+        if check_generation and snapshot['g'] != get_generation():
+            raise StaleSnapshot('roles changed since the snapshot was taken.')
+        perms = ['%s.%s' % (app_label, codename)
+                 for app_label, codenames in snapshot['perms'].items()
+                 for codename in codenames]
+        return cls(snapshot['pk'], perms, is_active=snapshot['active'],
+                   is_superuser=snapshot['super'], generation=snapshot['g'])
+
+    def get_all_permissions(self, obj=None):
+        if not self.is_active or obj is not None:
+            return set()
+        return set(self._perms)
+
+    def has_perm(self, perm, obj=None):
+        if not self.is_active or obj is not None:  # model level only
+            return False
+        return self.is_superuser or perm in self._perms
+
+    def has_perms(self, perm_list, obj=None):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def has_module_perms(self, app_label):
+        if not self.is_active:
+            return False
+        if self.is_superuser:
+            return True
+        for perm in self._perms:
+            if perm[:perm.index('.')] == app_label:
+                return True
+        return False
+
+
+def dumps(user):
+    return json.dumps(get_snapshot(user), separators=(',', ':'))
+
+
+def loads(data, check_generation=True):
+    return FrozenPrincipal.from_snapshot(json.loads(data), check_generation)
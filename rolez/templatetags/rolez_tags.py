@@ -0,0 +1,16 @@
+from django import template
+
+from rolez.prefetch import get_objects_with_role_perm
+
+register = template.Library()
+
+
+@register.simple_tag
+def objects_with_role_perm(user, perm, objects):
+    """
+    check perm on all objects of a loop at once:
+
+        {% objects_with_role_perm user 'blog.change_entry' entries as editable %}
+        {% for entry in entries %}{% if entry.pk in editable %}...{% endif %}{% endfor %}
+    """
+    return get_objects_with_role_perm(user, perm, objects)
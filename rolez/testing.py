@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.test import override_settings
+
+from rolez.generation import bump_generation
+from rolez.util import clear_cache
+
+BACKENDS = [
+    'rolez.backend.RoleModelBackend',
+    'rolez.backend.RoleListModelBackend',
+    'rolez.backend.RoleObjectBackend',
+    'rolez.backend.RoleScopeBackend',
+    'rolez.backend.RoleDefaultBackend',
+]
+
+# the queries a cold call may take, caches of the process and of the user empty; none grows
+# with the roles or their delegates, object checks run off the role index too (rolez.util)
+QUERY_BUDGETS = {
+    'has_perm': 2,
+    'has_obj_perm': 2,
+    'get_all_permissions': 2,
+    # over 2: the mixin counts django's ModelBackend (the user's and the groups' perms) and
+    # the role index, and the queries of RoleListModelBackend, 2 more, when it is configured
+    'UserRoleMixin.has_perm': 6,
+    'UserRoleMixin.has_obj_perm': 3,
+    'UserRoleMixin.get_all_permissions': 5,
+}
+
+
+def run_on_commit(using=None):
+    """
+    run the callbacks waiting for the commit of the transaction of a django TestCase, which
+    never commits; rolez moves to a new role generation on commit (see rolez.generation)
+    """
+    connection = transaction.get_connection(using)
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
+class QueryBudgetTestMixin(object):
+    """
+    for django test cases; asserts the query budgets (see rolez.budget) of the permission APIs
+    of each rolez backend, and of UserRoleMixin, calls made cold:
+
+        class PermissionBudgetTests(QueryBudgetTestMixin, TestCase):
+            def test_budgets(self):
+                self.assertQueryBudgets(user, 'blog.change_entry', entry)
+    """
+    query_budgets = QUERY_BUDGETS
+
+    def _get_checks(self, user_obj, perm, obj):
+        checks = [lambda: user_obj.has_perm(perm), user_obj.get_all_permissions]
+        if obj is not None:
+            checks.append(lambda: user_obj.has_perm(perm, obj))
+        if hasattr(user_obj, 'has_role_perm'):
+            checks += [lambda: user_obj.has_role_perm(perm), user_obj.get_all_role_perms]
+            if obj is not None:
+                checks.append(lambda: user_obj.has_role_perm(perm, obj))
+        return checks
+
+    def assertQueryBudgets(self, user_obj, perm, obj=None, budgets=None, backends=BACKENDS):
+        """
+        fail if a permission check of perm (on obj too, if given) of user_obj, or a
+        get_all_permissions, goes over budgets (query_budgets by default) with each of the
+        backends configured after django's ModelBackend
+        """
+        for backend in backends:
+            with self.subTest(backend=backend), override_settings(
+                    AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend',
+                                             backend],
+                    ROLE_QUERY_BUDGETS=budgets or self.query_budgets,
+                    ROLE_QUERY_BUDGET_RAISE=True):
+                for check in self._get_checks(user_obj, perm, obj):
+                    bump_generation()  # process local caches emptied
+                    clear_cache(user_obj)
+                    check()
@@ -0,0 +1,252 @@
+import threading
+import time
+from contextlib import contextmanager, ExitStack
+from functools import wraps
+
+from django.contrib.auth import models as auth_models, get_backends
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+
+_local = threading.local()
+
+# django.contrib.auth.models is patched while a trace is open in any thread
+_patch_lock = threading.Lock()
+_patched = 0
+_originals = {}
+
+
+class Step(object):
+    """
+    a node of the trace tree: a permission check, a backend consulted, a delegate tried, a
+    cache hit or an sql query
+    """
+    def __init__(self, name, **detail):
+        self.name = name
+        self.detail = detail
+        self.result = None
+        self.duration = None  # seconds
+        self.children = []
+
+    @property
+    def queries(self):
+        return [step for step in self.walk() if step.name == 'sql']
+
+    def walk(self):
+        for child in self.children:
+            yield child
+            yield from child.walk()
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'detail': {key: str(value) for key, value in self.detail.items()},
+            'result': self.result,
+            'duration': self.duration,
+            'children': [child.as_dict() for child in self.children],
+        }
+
+    def format(self, indent=0):
+        line = '  ' * indent + self.name
+        if self.detail:
+            line += ' ' + ' '.join('%s=%s' % item for item in self.detail.items())
+        if self.result is not None:
+            line += ': %s' % self.result
+        if self.duration is not None:
+            line += ' (%.2f ms' % (self.duration * 1000)
+            if self.name != 'sql':
+                line += ', %s queries' % len(self.queries)
+            line += ')'
+        return '\n'.join([line] + [child.format(indent + 1) for child in self.children])
+
+
+class Trace(Step):
+    def __init__(self):
+        super().__init__('trace')
+        self._stack = [self]
+
+    @property
+    def checks(self):
+        return self.children
+
+    def __str__(self):
+        return '\n'.join(check.format() for check in self.checks)
+
+
+def get_trace():
+    return getattr(_local, 'trace', None)
+
+
+class _NullStep(object):
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_step = _NullStep()
+
+
+class _Step(object):
+    def __init__(self, trace, step):
+        self.trace, self.step = trace, step
+
+    def __enter__(self):
+        self.trace._stack[-1].children.append(self.step)
+        self.trace._stack.append(self.step)
+        self.started = time.perf_counter()
+        return self.step
+
+    def __exit__(self, *exc_info):
+        self.step.duration = time.perf_counter() - self.started
+        self.trace._stack.pop()
+        return False
+
+
+def step(name, **detail):
+    """
+    context manager recording a step, and everything under it, in the active trace; a no op
+    (yielding None) when not tracing
+    """
+    trace = get_trace()
+    if trace is None:
+        return _null_step
+    return _Step(trace, Step(name, **detail))
+
+
+def note(name, **detail):
+    """
+    record an instant event, e.g. a cache hit, in the active trace
+    """
+    trace = get_trace()
+    if trace is not None:
+        trace._stack[-1].children.append(Step(name, **detail))
+
+
+def _record_sql(execute, sql, params, many, context):
+    with step('sql', sql=sql):
+        return execute(sql, params, many, context)
+
+
+def _describe(obj):
+    if obj is None:
+        return None
+    return '%s %s' % (obj._meta.label_lower, obj.pk)
+
+
+def traced(func):
+    """
+    record calls of func(user_obj, perm, obj=None) as steps of the active trace
+    """
+    @wraps(func)
+    def wrapper(user_obj, perm, obj=None):
+        if get_trace() is None:
+            return func(user_obj, perm, obj)
+        with step(func.__qualname__, perm=perm, obj=_describe(obj)) as called:
+            called.result = func(user_obj, perm, obj)
+        return called.result
+    return wrapper
+
+
+def _ask(method, user, *args):
+    # ask the backends like django does, with a step per backend consulted
+    for backend in get_backends():
+        if not hasattr(backend, method):
+            continue
+        with step(backend.__class__.__name__) as consulted:
+            try:
+                consulted.result = bool(getattr(backend, method)(user, *args))
+            except PermissionDenied:
+                consulted.result = 'denied'
+        if consulted.result == 'denied':
+            return False
+        if consulted.result:
+            return True
+    return False
+
+
+def _user_has_perm(user, perm, obj):
+    # django.contrib.auth.models._user_has_perm, with a step per check and backend
+    if get_trace() is None:
+        return _originals['_user_has_perm'](user, perm, obj)
+    with step('has_perm', perm=perm, obj=_describe(obj)) as check:
+        check.result = _ask('has_perm', user, perm, obj)
+    return check.result
+
+
+def _user_has_module_perms(user, app_label):
+    if get_trace() is None:
+        return _originals['_user_has_module_perms'](user, app_label)
+    with step('has_module_perms', app_label=app_label) as check:
+        check.result = _ask('has_module_perms', user, app_label)
+    return check.result
+
+
+def _user_get_all_permissions(user, obj):
+    # the result of each step is the number of perms
+    if get_trace() is None:
+        return _originals['_user_get_all_permissions'](user, obj)
+    permissions = set()
+    with step('get_all_permissions', obj=_describe(obj)) as check:
+        for backend in get_backends():
+            if hasattr(backend, 'get_all_permissions'):
+                with step(backend.__class__.__name__) as consulted:
+                    perms = backend.get_all_permissions(user, obj)
+                    consulted.result = len(perms)
+                permissions.update(perms)
+        check.result = len(permissions)
+    return permissions
+
+
+_replacements = {
+    '_user_has_perm': _user_has_perm,
+    '_user_has_module_perms': _user_has_module_perms,
+    '_user_get_all_permissions': _user_get_all_permissions,
+}
+
+
+def _patch():
+    global _patched
+    with _patch_lock:
+        if not _patched:
+            for name, replacement in _replacements.items():
+                if hasattr(auth_models, name):  # the names differ in later djangos
+                    _originals[name] = getattr(auth_models, name)
+                    setattr(auth_models, name, replacement)
+        _patched += 1
+
+
+def _unpatch():
+    global _patched
+    with _patch_lock:
+        _patched -= 1
+        if not _patched:
+            for name, original in _originals.items():
+                setattr(auth_models, name, original)
+
+
+@contextmanager
+def trace():
+    """
+    record the permission checks made in the block (of this thread) as a tree:
+
+        with rolez.trace() as t:
+            user.has_perm('blog.change_entry', entry)
+        print(t)
+
+    each check (has_perm, has_module_perms or get_all_permissions) lists the backends
+    consulted, delegates tried, cache hits and sql issued, with the time taken at every step
+    """
+    _patch()  # calls of the other threads pass through while patched
+    outer = get_trace()
+    _local.trace = current = Trace()
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_record_sql))
+            yield current
+    finally:
+        current.duration = time.perf_counter() - started
+        _local.trace = outer
+        _unpatch()
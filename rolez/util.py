@@ -1,12 +1,56 @@
+import threading
+import time
+
 from django.apps import apps
 from django.contrib.auth.models import Permission
 from django.conf import settings
+from django.db import router
+from django.db.models import Q
+
+from rolez.cache import is_enabled as shared_cache_enabled
+from rolez.generation import LocalCache
+from rolez.models import RoleClosure, AbstractTenantRole
+
+_local = threading.local()
+_local_cache = LocalCache()
 
 
 def get_role_model():
     return apps.get_model(settings.ROLE_MODEL)
 
 
+def has_backend(name):
+    """
+    return whether an authentication backend ending with name is configured
+    """
+    for backend in settings.AUTHENTICATION_BACKENDS:
+        if backend.endswith(name):
+            return True
+    return False
+
+
+def get_read_db():
+    """
+    return the database alias for the read only rolez queries; settings.ROLE_READ_DATABASE,
+    or where the routers send reads with the rolez hint. falls back to the primary after a
+    role change in the same thread, as a replica may not have it yet; until the end of the
+    request, or settings.ROLE_PRIMARY_PIN_SECONDS (5 by default), in a worker or a command
+    """
+    pinned_until = getattr(_local, 'pinned_until', None)
+    if pinned_until is not None and time.monotonic() < pinned_until:
+        return router.db_for_write(Permission)
+    alias = getattr(settings, 'ROLE_READ_DATABASE', None)
+    return alias or router.db_for_read(Permission, rolez=True)
+
+
+def pin_primary():
+    _local.pinned_until = time.monotonic() + getattr(settings, 'ROLE_PRIMARY_PIN_SECONDS', 5)
+
+
+def unpin_primary(**kwargs):
+    _local.pinned_until = None
+
+
 def get_cache_key(obj, perm):
     return (obj._meta.app_label, obj._meta.model_name, obj.pk, perm)
 
@@ -23,6 +67,17 @@ def clear_cache(user):
     # role object backend
     if hasattr(user, '_role_obj_cache'): del user._role_obj_cache
 
+    # role scope backend
+    if hasattr(user, '_role_scope_cache'): del user._role_scope_cache
+
+    # perms checked one at a time (see check_lazily)
+    if hasattr(user, '_role_model_checked'): del user._role_model_checked
+    if hasattr(user, '_roles_perm_checked'): del user._roles_perm_checked
+    if hasattr(user, '_all_role_perm_checked'): del user._all_role_perm_checked
+
+    # prefetched object perms
+    if hasattr(user, '_role_prefetch_cache'): del user._role_prefetch_cache
+
     # role mixin
     if hasattr(user, '_group_role_perm_cache'): del user._group_role_perm_cache
     if hasattr(user, '_user_role_perm_cache'): del user._user_role_perm_cache
@@ -37,6 +92,28 @@ def clear_cache(user):
     if hasattr(user, '_obj_perm_cache'): setattr(user, '_obj_perm_cache', {})
 
 
+def check_lazily(user_obj, memo_name, perm, check):
+    """
+    answer a perm check with check(), memoized in user_obj.<memo_name>, while fewer than
+    settings.ROLE_LAZY_PERMS_THRESHOLD perms have been checked; return None after that, for
+    the full perm set to be loaded. 0 (the default) always loads the full set, as do shared
+    entries (see rolez.cache), which are a single cache read
+    """
+    threshold = getattr(settings, 'ROLE_LAZY_PERMS_THRESHOLD', 0)
+    if not threshold or shared_cache_enabled():
+        return None
+    memo = getattr(user_obj, memo_name, None)
+    if memo is None:
+        memo = {}
+        setattr(user_obj, memo_name, memo)
+    if perm in memo:
+        return memo[perm]
+    if len(memo) >= threshold:
+        return None
+    memo[perm] = check()
+    return memo[perm]
+
+
 def get_perm_filter(perm):
     if isinstance(perm, str):
         app_label, codename = perm.split('.', 1)
@@ -46,12 +123,103 @@ def get_perm_filter(perm):
 
 
 def str_to_perm(perm_str):
-    return Permission.objects.get(**get_perm_filter(perm_str))
+    return Permission.objects.using(get_read_db()).get(**get_perm_filter(perm_str))
 
 
 def perms_to_str(perms):
     return {"%s.%s" % (ct, name) for ct, name in
-            perms.values_list('content_type__app_label', 'codename')}
+            perms.using(get_read_db()).values_list('content_type__app_label', 'codename')}
+
+
+def get_all_perms():
+    """
+    return all perms as strings; cached in the process until the role graph changes
+    """
+    return _local_cache.get_or_build(
+        'all_perms', lambda: frozenset(perms_to_str(Permission.objects.all())))
+
+
+def get_tenant(user_obj):
+    """
+    return the tenant of user_obj, its role_tenant attribute, when the role model is tenant
+    scoped (see rolez.models.AbstractTenantRole); None for all tenants
+    """
+    if not issubclass(get_role_model(), AbstractTenantRole):
+        return None
+    return getattr(user_obj, 'role_tenant', None) or None
+
+
+def _filter_tenant(queryset, tenant, prefix=''):
+    # the roles of tenant and the shared ones, with no tenant
+    if tenant is None:
+        return queryset
+    return queryset.filter(**{prefix + 'tenant__in': (tenant, '')})
+
+
+def _build_role_index(tenant=None):
+    index = {}
+    using = get_read_db()
+    # perms of each role, none for an empty one, and of the roles nested in it
+    rows = _filter_tenant(get_role_model().objects.using(using), tenant).values_list(
+        'delegate__content_type__app_label', 'delegate__codename',
+        'perms__content_type__app_label', 'perms__codename')
+    nested_rows = _filter_tenant(RoleClosure.objects.using(using), tenant, 'ancestor__') \
+        .filter(descendant__perms__isnull=False).values_list(
+            'ancestor__delegate__content_type__app_label', 'ancestor__delegate__codename',
+            'descendant__perms__content_type__app_label', 'descendant__perms__codename')
+    for rows in (rows, nested_rows):
+        for delegate_app, delegate, app_label, codename in rows:
+            perms = index.setdefault('%s.%s' % (delegate_app, delegate), set())
+            if codename is not None:
+                perms.add('%s.%s' % (app_label, codename))
+    return {delegate: frozenset(perms) for delegate, perms in index.items()}
+
+
+def get_role_index(tenant=None):
+    """
+    return {delegate: perms of the role (nested ones too)} for all roles, or the ones of
+    tenant and the shared ones, perms as strings; built in two queries, cached in the process
+    until the role graph changes (of that tenant)
+    """
+    return _local_cache.get_or_build('role_index', lambda: _build_role_index(tenant),
+                                     tenant=tenant)
+
+
+def _build_default_perms(names, tenant):
+    role_index = get_role_index(tenant)
+    roles = _filter_tenant(get_role_model().objects.using(get_read_db()), tenant)
+    delegates = roles.filter(name__in=names) \
+        .values_list('delegate__content_type__app_label', 'delegate__codename')
+    perms = set()
+    for app_label, codename in delegates:
+        delegate = '%s.%s' % (app_label, codename)
+        perms.add(delegate)
+        perms.update(role_index.get(delegate, ()))
+    return frozenset(perms)
+
+
+def get_default_perms(user_obj):
+    """
+    return the perms of the default roles of user_obj: settings.ROLE_ANONYMOUS_ROLES for
+    anonymous users, ROLE_AUTHENTICATED_ROLES for all active ones (role names); the
+    delegates included. on a tenant scoped role model the names are looked up by (tenant,
+    name), in the tenant of user_obj and the shared roles only, never in other tenants.
+    computed once per process, until the role graph changes
+    """
+    if user_obj.is_anonymous:
+        names = getattr(settings, 'ROLE_ANONYMOUS_ROLES', ())
+    elif user_obj.is_active:
+        names = getattr(settings, 'ROLE_AUTHENTICATED_ROLES', ())
+    else:
+        return frozenset()
+    if not names:
+        return frozenset()
+    names = tuple(sorted(names))
+    tenant = get_tenant(user_obj)
+    if tenant is None and issubclass(get_role_model(), AbstractTenantRole):
+        tenant = ''  # the shared roles only
+    return _local_cache.get_or_build(('default_perms', names),
+                                     lambda: _build_default_perms(names, tenant), tenant=tenant)
 
 
 def perm_to_str(perm_obj):
@@ -64,18 +232,42 @@ def get_role_from_delegate(delegate):
     return delegate.role
 
 
+def get_nested_roles(roles):
+    """
+    return the roles (a queryset or pks) together with the roles nested in them
+    """
+    return get_role_model().objects.filter(Q(pk__in=roles) | Q(ancestor_links__ancestor__in=roles))
+
+
+def get_roles_with_perm(perm):
+    """
+    return the roles including perm, directly or through a nested role
+    """
+    perm_filter = get_perm_filter(perm)
+    return get_role_model().objects.filter(
+        Q(**{'perms__' + key: value for key, value in perm_filter.items()})
+        | Q(**{'descendant_links__descendant__perms__' + key: value
+               for key, value in perm_filter.items()}))
+
+
 def get_perms_from_delegate(delegate):
-    return perms_to_str(get_role_from_delegate(delegate).perms)
+    return perms_to_str(get_roles_perms([get_role_from_delegate(delegate).pk]))
 
 
 def get_delegates(perm):
-    return perms_to_str(Permission.objects.filter(role__perms=perm))
+    return perms_to_str(Permission.objects.filter(role__in=get_roles_with_perm(perm)))
 
 
 def get_roles_perms(roles):
-    if roles.__len__() > 0 and not isinstance(roles[0], int):
-        roles = [role.pk for role in roles]
-    return Permission.objects.filter(roles__pk__in=roles)
+    """
+    return the perms of roles (a queryset or related manager, instances or pks) and of the
+    roles nested in them; a queryset of roles is used as a subquery, not loaded
+    """
+    if hasattr(roles, 'all'):
+        roles = roles.all().values('pk')
+    else:
+        roles = [getattr(role, 'pk', role) for role in roles]
+    return Permission.objects.using(get_read_db()).filter(roles__in=get_nested_roles(roles))
 
 
 def test_roles_for_perm(roles, perm):
@@ -83,10 +275,6 @@ def test_roles_for_perm(roles, perm):
 
 
 def test_role_for_perm(role, perm):
-    if isinstance(role, int):
-        return Permission.objects.filter(roles__pk=role) \
-            .filter(**get_perm_filter(perm)) \
-            .exists()
-    return role.perms \
-        .filter(**get_perm_filter(perm)) \
-        .exists()
+    if not isinstance(role, int):
+        role = role.pk
+    return get_roles_perms([role]).filter(**get_perm_filter(perm)).exists()
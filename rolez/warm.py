@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection, DatabaseError
+from django.db.models import F
+
+from rolez.cache import is_enabled, set_shared_perms, BACKEND_PERMS, MIXIN_PERMS
+from rolez.export import iter_effective_permissions
+from rolez.generation import check_generation
+from rolez.mixins import UserRoleMixin
+from rolez.util import get_role_index, get_all_perms, get_default_perms, has_backend
+
+logger = logging.getLogger('rolez')
+
+# export sources making up each kind of shared entry
+_SOURCES = {
+    BACKEND_PERMS: {'user_role', 'group_role'},
+    MIXIN_PERMS: {'user', 'group', 'user_role', 'group_role'},
+}
+
+
+def get_recent_users(limit):
+    """
+    return the pks of the limit most recently logged in active users
+    """
+    UserModel = get_user_model()
+    users = UserModel._default_manager.filter(is_active=True)
+    try:
+        UserModel._meta.get_field('last_login')
+        users = users.order_by(F('last_login').desc(nulls_last=True), '-pk')
+    except FieldDoesNotExist:
+        users = users.order_by('-pk')
+    return list(users.values_list('pk', flat=True)[:limit])
+
+
+def _get_kinds():
+    # the shared entries the configured backends read
+    if has_backend('RoleModelBackend'):
+        return {BACKEND_PERMS: _SOURCES[BACKEND_PERMS]}
+    if issubclass(get_user_model(), UserRoleMixin):
+        sources = set(_SOURCES[MIXIN_PERMS])
+        if has_backend('RoleListModelBackend'):
+            sources.add('roles')
+        return {MIXIN_PERMS: sources}
+    return {}
+
+
+def warm(users=1000, seconds=30, max_bytes=None, batch_size=500):
+    """
+    precompute the role index and the all perms set of this process, and the shared
+    effective permission entries (see rolez.cache) of the given number of most recently
+    active users, a batch of users at a time with a query per permission source. stops
+    after seconds, or when the entries stored reach max_bytes (perm string lengths summed)
+    """
+    started = time.monotonic()
+    stats = {'users': 0, 'bytes': 0, 'complete': True}
+    get_role_index()
+    get_all_perms()
+
+    kinds = _get_kinds()
+    if not users or not kinds or not is_enabled():
+        return stats
+
+    UserModel = get_user_model()
+    generation = check_generation()  # before reading; entries of a later change are not hit
+    pks = get_recent_users(users)
+    for i in range(0, len(pks), batch_size):
+        if seconds is not None and time.monotonic() - started > seconds:
+            stats['complete'] = False
+            break
+        batch = UserModel._default_manager.filter(pk__in=pks[i:i + batch_size])
+        entries = {kind: {pk: set() for pk in pks[i:i + batch_size]} for kind in kinds}
+        for row in iter_effective_permissions(users=batch):
+            for kind, sources in kinds.items():
+                if row.source in sources:
+                    entries[kind][row.user].add(row.permission)
+        if MIXIN_PERMS in entries:
+            if has_backend('RoleDefaultBackend'):  # the default roles are no export source
+                for user in batch:
+                    entries[MIXIN_PERMS][user.pk] |= get_default_perms(user)
+            # superusers are answered without the entries, which would outlive a demotion
+            for pk in batch.filter(is_superuser=True).values_list('pk', flat=True):
+                del entries[MIXIN_PERMS][pk]
+
+        size = sum(len(perm) for perms_by_user in entries.values()
+                   for perms in perms_by_user.values() for perm in perms)
+        if max_bytes is not None and stats['bytes'] + size > max_bytes:
+            stats['complete'] = False
+            break
+        for kind, perms_by_user in entries.items():
+            set_shared_perms(kind, perms_by_user, generation)
+        stats['users'] += len(pks[i:i + batch_size])
+        stats['bytes'] += size
+    return stats
+
+
+def _warm_on_ready():
+    try:
+        stats = warm(users=getattr(settings, 'ROLE_WARM_USERS', 1000),
+                     seconds=getattr(settings, 'ROLE_WARM_SECONDS', 30),
+                     max_bytes=getattr(settings, 'ROLE_WARM_MAX_BYTES', None))
+        logger.info('rolez caches warmed: %s', stats)
+    except DatabaseError:  # e.g. not migrated yet
+        logger.warning('rolez caches not warmed', exc_info=True)
+    finally:
+        connection.close()
+
+
+def warm_on_ready():
+    """
+    warm the caches in the background on app ready if settings.ROLE_WARM_ON_READY is True;
+    settings.ROLE_WARM_USERS, ROLE_WARM_SECONDS and ROLE_WARM_MAX_BYTES are the limits
+    """
+    if getattr(settings, 'ROLE_WARM_ON_READY', False):
+        threading.Thread(target=_warm_on_ready, name='rolez-warm', daemon=True).start()
@@ -7,7 +7,8 @@ from django.conf import settings
 from django.test.utils import get_runner
 
 if __name__ == "__main__":
-    os.environ['DJANGO_SETTINGS_MODULE'] = 'tests.settings'
+    # tests.settings_tenant runs the suite against a tenant scoped role model
+    os.environ['DJANGO_SETTINGS_MODULE'] = sys.argv[1] if len(sys.argv) > 1 else 'tests.settings'
     django.setup()
     TestRunner = get_runner(settings)
     test_runner = TestRunner()
@@ -16,11 +16,30 @@ INSTALLED_APPS = (
 
 DEBUG = True
 
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.contrib.auth.context_processors.auth',
+                'rolez.context_processors.role_perms',
+            ],
+        },
+    },
+]
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'tests/test_app/db.sqlite3'),
-    }
+    },
+    # for ROLE_READ_DATABASE; the same database in tests
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'tests/test_app/db.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
 # usually overridden in tests
@@ -37,4 +56,11 @@ GUARDIAN_ALLOW_CROSS_MODEL_PERMISSIONS = True
 
 AUTH_USER_MODEL = 'test_app.RoleUser'
 
-ROLE_MODEL = 'test_app.Role'
\ No newline at end of file
+ROLE_MODEL = 'test_app.Role'
+
+ROLE_SCOPE_RELATIONS = {
+    'test_app.entry': ['blog'],
+}
+
+# a single test process; the local memory cache is shared enough
+SILENCED_SYSTEM_CHECKS = ['rolez.W001']
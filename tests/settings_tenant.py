@@ -0,0 +1,6 @@
+from tests.settings import *  # noqa
+
+# test_app.Role scoped by tenant, migrated by its own migrations
+TEST_TENANT_ROLES = True
+
+MIGRATION_MODULES = {'test_app': 'tests.test_app.tenant_migrations'}
@@ -0,0 +1,77 @@
+from django.contrib.admin import AdminSite
+from django.contrib.admin.widgets import AutocompleteSelectMultiple
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin, GroupAdmin
+from django.contrib.auth.models import Permission, Group
+from django.test import TestCase as ModelTestCase, RequestFactory
+
+from rolez.admin import PermissionAdmin, RoleAdmin, UserRoleAdminMixin
+from rolez.util import get_role_model
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+class RoleUserAdmin(UserRoleAdminMixin, UserAdmin):
+    pass
+
+
+class AdminTests(ModelTestCase):
+    def setUp(self):
+        self.site = AdminSite()
+        self.site.register(Permission, PermissionAdmin)
+        self.site.register(Group, GroupAdmin)
+        self.site.register(Role, RoleAdmin)
+        self.site.register(UserModel, RoleUserAdmin)
+
+        self.brandon = UserModel.objects.create(username='brandon', is_superuser=True)
+        self.jack = UserModel.objects.create(username='jack')
+
+        self.manager_role = Role.objects.create(name='manager')  # author change, delete
+        self.editor_role = Role.objects.create(name='editor')
+        self.manager_role.perms.add(Permission.objects.get(codename='change_author'),
+                                    Permission.objects.get(codename='delete_author'))
+
+        self.jack.user_permissions.add(self.manager_role.delegate,
+                                       Permission.objects.get(codename='add_blog'))
+        self.jack.roles.add(self.editor_role)
+
+        self.request = RequestFactory().get('/')
+        self.request.user = self.brandon
+
+    def test_checks(self):
+        for model_admin in self.site._registry.values():
+            self.assertEqual(model_admin.check(), [])
+
+    def test_role_queryset(self):
+        model_admin = self.site._registry[Role]
+        with self.assertNumQueries(1):
+            roles = {role.name: (model_admin.perm_count(role), role.delegate.content_type.model)
+                     for role in model_admin.get_queryset(self.request)}
+        self.assertEqual(roles, {'manager': (2, 'role'), 'editor': (0, 'role')})
+
+    def test_user_queryset(self):
+        model_admin = self.site._registry[UserModel]
+        self.assertIn('role_count', model_admin.get_list_display(self.request))
+        with self.assertNumQueries(1):
+            users = {user.username: model_admin.role_count(user)
+                     for user in model_admin.get_queryset(self.request)
+                     .filter(username__in=['brandon', 'jack'])}
+        self.assertEqual(users, {'brandon': 0, 'jack': 2})
+        # counted in subqueries, not over the joined m2m rows
+        self.assertIsNone(model_admin.get_queryset(self.request).query.group_by)
+
+    def test_pickers(self):
+        form = self.site._registry[Role].get_form(self.request)
+        field = form.base_fields['perms']
+        self.assertIsInstance(field.widget.widget, AutocompleteSelectMultiple)
+        self.assertEqual(field.queryset.query.select_related, {'content_type': {}})
+        self.assertNotIn('delegate', form.base_fields)
+
+        model_admin = self.site._registry[UserModel]
+        self.assertEqual(model_admin.get_autocomplete_fields(self.request),
+                         ('groups', 'user_permissions', 'roles'))
+        form = model_admin.get_form(self.request, self.jack)
+        for name in ('groups', 'user_permissions'):  # roles is not in the fieldsets
+            self.assertIsInstance(form.base_fields[name].widget.widget,
+                                  AutocompleteSelectMultiple)
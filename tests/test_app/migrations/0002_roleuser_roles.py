@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roleuser',
+            name='roles',
+            field=models.ManyToManyField(blank=True, related_name='users', to='test_app.Role'),
+        ),
+    ]
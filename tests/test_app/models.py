@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
-from rolez.models import AbstractRole
+from guardian.models import UserObjectPermissionBase
+from rolez.models import AbstractRole, AbstractTenantRole
 from rolez.mixins import UserRoleMixin
 
 
@@ -56,9 +58,14 @@ class Entry(models.Model):
         return self.n_comments + self.n_pingbacks
 
 
+class EntryUserObjectPermission(UserObjectPermissionBase):  # a direct foreign key one
+    content_object = models.ForeignKey(Entry, on_delete=models.CASCADE)
+
+
 class RoleUser(UserRoleMixin, AbstractUser):
-    pass
+    roles = models.ManyToManyField('Role', blank=True, related_name='users')  # for RoleListModelBackend
 
 
-class Role(AbstractRole):
+# the suite runs against the tenant scoped variant too, with tests.settings_tenant
+class Role(AbstractTenantRole if getattr(settings, 'TEST_TENANT_ROLES', False) else AbstractRole):
     pass
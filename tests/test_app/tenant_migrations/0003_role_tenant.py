@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_app', '0002_roleuser_roles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='role',
+            name='tenant',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=28),
+        ),
+        migrations.AlterField(
+            model_name='role',
+            name='name',
+            field=models.CharField(max_length=60),
+        ),
+        migrations.AlterUniqueTogether(
+            name='role',
+            unique_together={('tenant', 'name')},
+        ),
+    ]
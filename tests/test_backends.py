@@ -1,7 +1,9 @@
-from django.contrib.auth.models import Permission, Group
+from django.contrib.auth.models import Permission, Group, AnonymousUser
 from django.test import TestCase as ModelTestCase, override_settings
 from tests.test_app.models import Author, Blog, Role
-from rolez.backend import RoleModelBackend, RoleObjectBackend
+from rolez.backend import RoleModelBackend, RoleListModelBackend, RoleObjectBackend, \
+    RoleDefaultBackend
+from rolez.testing import run_on_commit
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
 from guardian.shortcuts import assign_perm
@@ -112,6 +114,39 @@ class RoleModelBackendTests(BackendTestsCommon, ModelTestCase):
                           'test_app.add_blog', 'test_app.change_blog'})
 
 
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'rolez.backend.RoleListModelBackend',
+    ],
+)
+class RoleListModelBackendTests(ModelTestCase):
+    def setUp(self):
+        BackendTestsCommon.setUp(self)
+        self.backend = RoleListModelBackend()
+        self.admin_role = Role.objects.create(name='admin')  # editor
+        self.admin_role.perms.add(self.editor_role.delegate)
+
+    def test_has_perm(self):
+        self.brandon.roles.add(self.manager_role, self.admin_role)
+        with self.assertNumQueries(1):  # the full set, once
+            self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_author'), True)
+            self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_author'), True)
+            self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_blog'), True)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.add_blog'), False)
+        self.assertIs(self.backend.has_perm(self.jack, 'test_app.change_author'), False)
+
+    def test_get_all_permissions(self):
+        self.brandon.roles.add(self.manager_role, self.admin_role)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_all_permissions(self.brandon), {
+                'test_app.change_author', 'test_app.delete_author', 'test_app.use_role_editor',
+                'test_app.change_blog'})
+        with self.assertNumQueries(0):  # answered from the set now
+            self.assertIs(self.backend.has_perm(self.brandon, 'test_app.add_blog'), False)
+        self.assertEqual(self.backend.get_all_permissions(self.jack), set())
+
+
 @override_settings(
     AUTHENTICATION_BACKENDS=[
         'django.contrib.auth.backends.ModelBackend',
@@ -187,3 +222,103 @@ class RoleObjectBackendTests(BackendTestsCommon, ModelTestCase):
 
         self.assertIs(self.brandon.has_perm('test_app.use_role_editor', self.twain), False)
         self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_blog', self.twain), False)
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'rolez.backend.RoleModelBackend',
+    ],
+    ROLE_LAZY_PERMS_THRESHOLD=2,
+)
+class LazyPermsTests(ModelTestCase):
+    def setUp(self):
+        BackendTestsCommon.setUp(self)
+        self.backend = RoleModelBackend()
+        self.admins_group.permissions.add(self.manager_role.delegate)
+        self.brandon.user_permissions.add(self.author_role.delegate)
+
+    def test_backend(self):
+        with self.assertNumQueries(1):  # an exists
+            self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_author'), True)
+        with self.assertNumQueries(0):
+            self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_author'), True)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.add_blog'), True)
+        self.assertFalse(hasattr(self.brandon, '_role_model_cache'))
+
+        # over the threshold
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.add_author'), False)
+        self.assertEqual(self.brandon._role_model_cache, {
+            'test_app.change_author', 'test_app.delete_author', 'test_app.change_blog',
+            'test_app.add_blog'})
+
+        self.backend.clear_cache(self.brandon)
+        self.assertIs(self.backend.has_perm(self.jack, 'test_app.change_author'), False)
+        self.assertEqual(len(self.backend.get_all_permissions(self.brandon)), 4)  # whole set
+
+    def test_roles_list(self):
+        backend = RoleListModelBackend()
+        self.brandon.roles.add(self.manager_role)
+        with self.assertNumQueries(1):  # an exists, remembered
+            self.assertIs(backend.has_perm(self.brandon, 'test_app.change_author'), True)
+            self.assertIs(backend.has_perm(self.brandon, 'test_app.change_author'), True)
+        self.assertIs(backend.has_perm(self.brandon, 'test_app.add_blog'), False)
+        self.assertFalse(hasattr(self.brandon, '_roles_perm_cache'))
+
+        # over the threshold
+        self.assertIs(backend.has_perm(self.brandon, 'test_app.delete_author'), True)
+        self.assertEqual(self.brandon._roles_perm_cache,
+                         {'test_app.change_author', 'test_app.delete_author'})
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'])
+    def test_mixin(self):
+        self.assertIs(self.brandon.has_role_perm('test_app.change_author'), True)
+        self.assertIs(self.brandon.has_role_perm('test_app.add_author'), False)
+        self.assertFalse(hasattr(self.brandon, '_all_role_perm_cache'))
+        with self.assertNumQueries(0):
+            self.assertIs(self.brandon.has_role_perm('test_app.change_author'), True)
+
+        self.assertIs(self.brandon.has_role_perm('test_app.change_blog'), True)
+        self.assertIn('test_app.change_blog', self.brandon._all_role_perm_cache)
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'rolez.backend.RoleDefaultBackend',
+    ],
+    ROLE_ANONYMOUS_ROLES=['editor'],
+    ROLE_AUTHENTICATED_ROLES=['manager', 'editor'],
+)
+class RoleDefaultBackendTests(ModelTestCase):
+    def setUp(self):
+        BackendTestsCommon.setUp(self)
+        self.backend = RoleDefaultBackend()
+
+    def test_anonymous(self):
+        anonymous = AnonymousUser()
+        self.assertIs(anonymous.has_perm('test_app.change_blog'), True)
+        self.assertIs(anonymous.has_perm('test_app.change_author'), False)
+        self.assertIs(anonymous.has_module_perms('test_app'), True)
+        self.assertIs(anonymous.has_perm('test_app.change_blog', self.twain_blog), False)
+
+    def test_authenticated(self):
+        self.assertEqual(self.backend.get_all_permissions(self.brandon), {
+            'test_app.change_author', 'test_app.delete_author', 'test_app.change_blog',
+            'test_app.use_role_manager', 'test_app.use_role_editor'})
+        with self.assertNumQueries(0):  # computed once, for all users
+            self.assertIs(self.backend.has_perm(self.jack, 'test_app.change_author'), True)
+            self.assertIs(self.backend.has_perm(self.jack, 'test_app.add_blog'), False)
+
+        self.jack.is_active = False
+        self.assertIs(self.backend.has_perm(self.jack, 'test_app.change_author'), False)
+
+    def test_role_graph_change(self):
+        self.assertIs(self.brandon.has_perm('test_app.add_blog'), False)
+        self.editor_role.perms.add(self.add_blog)
+        run_on_commit()
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.add_blog'), True)
+
+    def test_mixin(self):
+        self.assertIn('test_app.change_author', self.brandon.get_all_role_perms())
+        self.assertIs(self.brandon.has_role_perm('test_app.delete_author'), True)
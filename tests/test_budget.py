@@ -0,0 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.test import TestCase as ModelTestCase, override_settings
+
+from rolez.budget import QueryBudgetExceeded
+from rolez.scope import assign_scoped_role
+from rolez.testing import QueryBudgetTestMixin
+from rolez.util import get_role_model
+from tests.test_app.models import Blog
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, ModelTestCase):
+    def setUp(self):
+        self.users_group = Group.objects.create(name='users')
+        self.jack = UserModel.objects.create(username='jack')
+        self.jack.groups.add(self.users_group)
+
+        self.editor_role = Role.objects.create(name='editor')  # blog change
+        self.manager_role = Role.objects.create(name='manager')  # editor, author change
+        self.editor_role.perms.add(Permission.objects.get(codename='change_blog'))
+        self.manager_role.perms.add(self.editor_role.delegate,
+                                    Permission.objects.get(codename='change_author'))
+        self.users_group.permissions.add(self.manager_role.delegate)
+        self.jack.roles.add(self.editor_role)
+
+        self.blog = Blog.objects.create(name='twain personal blog')
+        assign_scoped_role(self.editor_role, self.jack, self.blog)
+
+    def test_backends(self):
+        self.assertQueryBudgets(self.jack, 'test_app.change_blog', self.blog)
+        self.assertQueryBudgets(self.jack, 'test_app.add_blog', self.blog)
+
+    def test_many_delegates(self):
+        change_blog = Permission.objects.get(codename='change_blog')
+        for i in range(10):
+            Role.objects.create(name='editor %s' % i).perms.add(change_blog)
+        self.assertQueryBudgets(self.jack, 'test_app.change_blog', self.blog)
+        self.assertQueryBudgets(self.jack, 'test_app.add_blog', self.blog)
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=['rolez.backend.RoleModelBackend'],
+        ROLE_QUERY_BUDGETS={'has_perm': 1},
+        ROLE_QUERY_BUDGET_RAISE=True,
+    )
+    def test_raise(self):
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            self.jack.has_perm('test_app.change_blog')
+        self.assertIn('RoleModelBackend.has_perm made 2 queries, over its budget of 1, at %s'
+                      % __file__, str(raised.exception))
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=['rolez.backend.RoleModelBackend'],
+        ROLE_QUERY_BUDGETS={'has_perm': 0, 'RoleModelBackend.has_perm': 1},
+    )
+    def test_log(self):
+        with self.assertLogs('rolez', 'WARNING') as logs:
+            self.assertTrue(self.jack.has_perm('test_app.change_blog'))
+        budget = logs.records[0].rolez_budget
+        self.assertEqual((budget['api'], budget['budget'], len(budget['queries'])),
+                         ('RoleModelBackend.has_perm', 1, 2))
+        self.assertTrue(budget['call_site'].startswith(__file__))
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=['rolez.backend.RoleModelBackend'],
+        ROLE_QUERY_BUDGETS={'has_obj_perm': 0, 'RoleListModelBackend.has_perm': 0},
+        ROLE_QUERY_BUDGET_RAISE=True,
+    )
+    def test_other_apis(self):
+        self.assertTrue(self.jack.has_perm('test_app.change_blog'))
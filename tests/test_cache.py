@@ -0,0 +1,110 @@
+import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.test import TestCase as ModelTestCase, override_settings
+
+from guardian.shortcuts import assign_perm, remove_perm
+import rolez
+from rolez.generation import OBJ_GENERATION_KEY, bump_obj_generation, _get_cache
+from rolez.scope import assign_scoped_role
+from rolez.util import get_role_model
+from rolez.testing import run_on_commit
+from tests.test_app.models import Blog, Entry, EntryUserObjectPermission
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+@override_settings(
+    ROLE_SHARED_CACHE=True,
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'guardian.backends.ObjectPermissionBackend',
+    ],
+)
+class SharedObjectCacheTests(ModelTestCase):
+    def setUp(self):
+        self.users_group = Group.objects.create(name='users')
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.jack = UserModel.objects.create(username='jack')
+        self.jack.groups.add(self.users_group)
+
+        self.editor_role = Role.objects.create(name='editor')  # blog change
+        content_type = ContentType.objects.get_for_model(Blog)
+        self.view_blog = Permission.objects.get(content_type=content_type, codename='view_blog')
+        self.editor_role.perms.add(
+            Permission.objects.get(content_type=content_type, codename='change_blog'))
+
+        self.blog = Blog.objects.create(name='twain personal blog')
+        assign_scoped_role(self.editor_role, self.users_group, self.blog)
+
+    def get(self, user):
+        return UserModel.objects.get(pk=user.pk)
+
+    def check(self, user):
+        # a fresh instance, as in another request; returns the result and whether it was built
+        user = UserModel.objects.get(pk=user.pk)
+        with rolez.trace() as t:
+            granted = user.has_role_perm('test_app.change_blog', self.blog)
+        return granted, 'scoped roles' in [step.name for step in t.walk()]
+
+    def test_positive_and_negative(self):
+        self.assertEqual(self.check(self.jack), (True, True))
+        self.assertEqual(self.check(self.jack), (True, False))
+        self.assertEqual(self.check(self.brandon), (False, True))
+        self.assertEqual(self.check(self.brandon), (False, False))
+
+    def test_role_graph_change(self):
+        self.check(self.brandon)
+        assign_scoped_role(self.editor_role, self.brandon, self.blog)
+        run_on_commit()
+        self.assertEqual(self.check(self.brandon), (True, True))
+
+    def test_guardian_change(self):
+        self.check(self.brandon)
+        generation = _get_cache().get(OBJ_GENERATION_KEY)
+        assign_perm(self.view_blog, self.brandon, self.blog)
+        self.assertGreater(_get_cache().get(OBJ_GENERATION_KEY), generation)
+        self.assertEqual(self.check(self.brandon), (False, True))
+
+        generation = _get_cache().get(OBJ_GENERATION_KEY)
+        remove_perm(self.view_blog, self.brandon, self.blog)
+        self.assertGreater(_get_cache().get(OBJ_GENERATION_KEY), generation)
+
+    def test_guardian_bulk_change(self):
+        self.check(self.brandon)
+        generation = _get_cache().get(OBJ_GENERATION_KEY)
+        assign_perm(self.view_blog, UserModel.objects.filter(pk=self.brandon.pk), self.blog)
+        self.assertEqual(_get_cache().get(OBJ_GENERATION_KEY), generation)  # bulk_create
+        self.assertEqual(self.check(self.brandon), (False, False))
+
+        bump_obj_generation()
+        self.assertEqual(self.check(self.brandon), (False, True))
+
+    def test_guardian_direct_change(self):
+        entry = Entry.objects.create(
+            blog=self.blog, headline='a', body_text='', pub_date=datetime.date.today(),
+            mod_date=datetime.date.today(), n_comments=0, n_pingbacks=0, rating=0, status=0)
+        generation = _get_cache().get(OBJ_GENERATION_KEY)
+        assign_perm('test_app.change_entry', self.brandon, entry)
+        self.assertTrue(EntryUserObjectPermission.objects.exists())
+        self.assertGreater(_get_cache().get(OBJ_GENERATION_KEY), generation)
+
+    @override_settings(AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'rolez.backend.RoleObjectBackend',
+        'rolez.backend.RoleScopeBackend',
+    ])
+    def test_deactivated_user(self):
+        self.assertIs(self.get(self.jack).has_perm('test_app.change_blog', self.blog), True)
+        self.jack.is_active = False
+        self.jack.save()
+        self.assertIs(self.get(self.jack).has_perm('test_app.change_blog', self.blog), False)
+        self.assertEqual(self.check(self.jack), (False, False))
+
+    @override_settings(ROLE_SHARED_CACHE=False)
+    def test_disabled(self):
+        self.check(self.jack)
+        self.assertEqual(self.check(self.jack), (True, True))
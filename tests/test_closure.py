@@ -0,0 +1,105 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import transaction
+from django.test import TestCase as ModelTestCase, override_settings
+
+from rolez.backend import RoleModelBackend
+from rolez.closure import RoleCycleError, rebuild_closure
+from rolez.models import RoleClosure
+from rolez.util import clear_cache, get_role_model, get_perms_from_delegate, test_role_for_perm
+from tests.test_app.models import Author, Blog
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'rolez.backend.RoleModelBackend',
+    ],
+)
+class RoleClosureTests(ModelTestCase):
+    def setUp(self):
+        self.brandon = UserModel.objects.create(username='brandon')
+
+        self.admin_role = Role.objects.create(name='admin')  # manager, editor
+        self.manager_role = Role.objects.create(name='manager')  # author change; author
+        self.author_role = Role.objects.create(name='author')  # blog add
+        self.editor_role = Role.objects.create(name='editor')  # blog change
+
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        content_type = ContentType.objects.get_for_model(Blog)
+        self.change_blog = Permission.objects.get(content_type=content_type, codename='change_blog')
+        self.add_blog = Permission.objects.get(content_type=content_type, codename='add_blog')
+
+        self.admin_role.perms.add(self.manager_role.delegate, self.editor_role.delegate)
+        self.manager_role.perms.add(self.change_author, self.author_role.delegate)
+        self.author_role.perms.add(self.add_blog)
+        self.editor_role.perms.add(self.change_blog)
+
+        self.backend = RoleModelBackend()
+
+    def get_closure(self):
+        return set(RoleClosure.objects.values_list('ancestor__name', 'descendant__name', 'depth'))
+
+    def test_closure(self):
+        closure = {
+            ('admin', 'manager', 1),
+            ('admin', 'editor', 1),
+            ('admin', 'author', 2),
+            ('manager', 'author', 1),
+        }
+        self.assertEqual(self.get_closure(), closure)
+
+        rebuild_closure()
+        self.assertEqual(self.get_closure(), closure)
+
+    def test_nested_role_perms(self):
+        self.brandon.user_permissions.add(self.admin_role.delegate)
+        self.assertEqual(self.backend.get_all_permissions(self.brandon), {
+            'test_app.use_role_manager', 'test_app.use_role_editor', 'test_app.use_role_author',
+            'test_app.change_author', 'test_app.add_blog', 'test_app.change_blog'})
+
+        self.assertEqual(get_perms_from_delegate(self.manager_role.delegate),
+                         {'test_app.use_role_author', 'test_app.change_author',
+                          'test_app.add_blog'})
+        self.assertIs(test_role_for_perm(self.admin_role, self.add_blog), True)
+        self.assertIs(test_role_for_perm(self.editor_role, self.add_blog), False)
+
+    def test_cycle(self):
+        # m2m add runs in the test transaction, hence the savepoints
+        with self.assertRaises(RoleCycleError), transaction.atomic():
+            self.author_role.perms.add(self.admin_role.delegate)
+        with self.assertRaises(RoleCycleError), transaction.atomic():
+            self.author_role.perms.add(self.author_role.delegate)
+        with self.assertRaises(RoleCycleError), transaction.atomic():
+            self.admin_role.delegate.roles.add(self.author_role)
+        self.assertIs(test_role_for_perm(self.author_role, self.admin_role.delegate), False)
+
+    def test_remove_nested_role(self):
+        self.brandon.user_permissions.add(self.admin_role.delegate)
+
+        self.manager_role.perms.remove(self.author_role.delegate)
+        self.assertEqual(self.get_closure(), {('admin', 'manager', 1), ('admin', 'editor', 1)})
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.add_blog'), False)
+
+        self.author_role.delegate.roles.add(self.editor_role)
+        self.assertIn(('admin', 'author', 2), self.get_closure())
+        clear_cache(self.brandon)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.add_blog'), True)
+
+        self.admin_role.perms.clear()
+        self.assertEqual(self.get_closure(), {('editor', 'author', 1)})
+
+    def test_delete_nested_role(self):
+        self.manager_role.delete()
+        self.assertEqual(self.get_closure(), {('admin', 'editor', 1)})
+
+    def test_expansion_queries(self):
+        self.brandon.user_permissions.add(self.admin_role.delegate)
+        with self.assertNumQueries(2):  # user and group perms; independent of depth
+            self.backend.get_all_permissions(self.brandon)
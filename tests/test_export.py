@@ -0,0 +1,100 @@
+import json
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.core.management import call_command
+from django.test import TestCase as ModelTestCase, override_settings
+
+from rolez.export import iter_effective_permissions, PermissionRow
+from rolez.util import get_role_model
+from rolez.testing import run_on_commit
+from tests.test_app.models import Author, Blog
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+class ExportTests(ModelTestCase):
+    def setUp(self):
+        self.admins_group = Group.objects.create(name='admins')
+
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.jack = UserModel.objects.create(username='jack')
+        self.brandon.groups.add(self.admins_group)
+
+        self.admin_role = Role.objects.create(name='admin')  # manager
+        self.manager_role = Role.objects.create(name='manager')  # author change
+
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        content_type = ContentType.objects.get_for_model(Blog)
+        self.add_blog = Permission.objects.get(content_type=content_type, codename='add_blog')
+
+        self.manager_role.perms.add(self.change_author)
+        self.admin_role.perms.add(self.manager_role.delegate)
+
+        self.brandon.user_permissions.add(self.add_blog)
+        self.admins_group.permissions.add(self.manager_role.delegate)
+        self.jack.user_permissions.add(self.admin_role.delegate)
+        self.jack.roles.add(self.manager_role)
+
+    def test_iter_effective_permissions(self):
+        brandon, jack = self.brandon.pk, self.jack.pk
+        self.assertEqual(set(iter_effective_permissions()), {
+            PermissionRow(brandon, 'brandon', 'test_app.add_blog', 'user', None),
+            PermissionRow(brandon, 'brandon', 'test_app.use_role_manager', 'group', None),
+            PermissionRow(brandon, 'brandon', 'test_app.change_author', 'group_role', 'manager'),
+            PermissionRow(jack, 'jack', 'test_app.use_role_admin', 'user', None),
+            PermissionRow(jack, 'jack', 'test_app.use_role_manager', 'user_role', 'admin'),
+            PermissionRow(jack, 'jack', 'test_app.change_author', 'user_role', 'admin'),
+            PermissionRow(jack, 'jack', 'test_app.change_author', 'roles', 'manager'),
+        })
+
+        rows = iter_effective_permissions(users=UserModel.objects.filter(username='brandon'))
+        self.assertEqual({row.user for row in rows}, {brandon})
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'rolez.backend.RoleDefaultBackend',
+        ],
+        ROLE_AUTHENTICATED_ROLES=['manager'],
+    )
+    def test_default_roles(self):
+        run_on_commit()
+        self.brandon.is_active = False
+        self.brandon.save()
+        users = UserModel.objects.filter(pk__in=[self.brandon.pk, self.jack.pk])
+        rows = {row for row in iter_effective_permissions(users=users)
+                if row.source == 'default_role'}
+        self.assertEqual(rows, {
+            PermissionRow(self.jack.pk, 'jack', 'test_app.use_role_manager', 'default_role',
+                          'manager'),
+            PermissionRow(self.jack.pk, 'jack', 'test_app.change_author', 'default_role',
+                          'manager'),
+        })
+
+    def test_inactive_users(self):
+        self.jack.is_active = False
+        self.jack.save()
+        self.assertEqual({row.user for row in iter_effective_permissions()}, {self.brandon.pk})
+        self.assertEqual({row.user for row in iter_effective_permissions(only_active=False)},
+                         {self.brandon.pk, self.jack.pk})
+
+    def test_rolez_export(self):
+        out = StringIO()
+        call_command('rolez_export', format='jsonl', chunk_size=1, stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertIn({'user': self.jack.pk, 'username': 'jack',
+                       'permission': 'test_app.change_author', 'source': 'roles',
+                       'role': 'manager'}, rows)
+
+        out = StringIO()
+        call_command('rolez_export', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'user,username,permission,source,role')
+        self.assertEqual(len(lines), 8)
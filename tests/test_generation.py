@@ -0,0 +1,198 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.signals import request_started
+from django.db import connection
+from django.test import TestCase as ModelTestCase, TransactionTestCase, override_settings
+
+from rolez.generation import get_generation, bump_generation, check_generation, LocalCache, \
+    GENERATION_KEY, CHANGED_KEY, _get_cache
+from rolez.backend import RoleDefaultBackend
+from rolez.checks import check_generation_store
+from rolez.models import RoleGeneration
+from rolez.util import get_role_model
+from rolez.testing import run_on_commit
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+@override_settings(ROLE_GENERATION_CHECK_INTERVAL=0)  # other nodes are seen right away
+class GenerationTests(ModelTestCase):
+    def setUp(self):
+        self.cache = LocalCache()
+        check_generation()
+        self.cache.set('key', 'value')
+
+    def test_bump_on_role_change(self):
+        generation = get_generation()
+        role = Role.objects.create(name='manager')
+        self.assertEqual(get_generation(), generation)  # not before the commit
+        run_on_commit()
+        self.assertGreater(get_generation(), generation)
+
+        generation = get_generation()
+        role.perms.add(Permission.objects.get(codename='change_author'))
+        run_on_commit()
+        self.assertGreater(get_generation(), generation)
+
+    def test_local_bump_clears(self):
+        bump_generation()
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.cache.get('key'))
+
+    def test_remote_bump_clears(self):
+        self.assertEqual(self.cache.get('key'), 'value')
+        _get_cache().incr(GENERATION_KEY)  # another node
+        self.assertIsNone(self.cache.get('key'))
+
+    @override_settings(ROLE_GENERATION_CHECK_INTERVAL=None)
+    def test_check_once_per_request(self):
+        _get_cache().incr(GENERATION_KEY)
+        self.assertEqual(self.cache.get('key'), 'value')  # not before the next request
+
+        request_started.send(sender=self.__class__)
+        self.assertIsNone(self.cache.get('key'))
+
+    @override_settings(ROLE_GENERATION_CHECK_INTERVAL=60)
+    def test_check_interval(self):
+        _get_cache().incr(GENERATION_KEY)
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    @override_settings(ROLE_GENERATION_STORE='database')
+    def test_database_store(self):
+        generation = get_generation()
+        self.assertEqual(RoleGeneration.objects.get().value, generation)
+        self.assertEqual(bump_generation(), generation + 1)
+        self.assertIsNone(self.cache.get('key'))
+
+        self.cache.set('key', 'value')
+        RoleGeneration.objects.update(value=generation + 5)  # another node
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_tenant_bump_keeps_other_tenants(self):
+        self.cache.set('key', 'acme', tenant='acme')
+        self.cache.set('key', 'globex', tenant='globex')
+        bump_generation('acme')
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.cache.get('key', tenant='acme'))
+            self.assertIsNone(self.cache.get('key'))  # across tenants
+            self.assertEqual(self.cache.get('key', tenant='globex'), 'globex')
+
+    def test_remote_tenant_bump(self):
+        self.cache.set('key', 'globex', tenant='globex')
+        cache = _get_cache()
+        for tenant in ('acme', 'initech'):  # another node
+            cache.set(CHANGED_KEY % cache.incr(GENERATION_KEY), tenant)
+        self.assertEqual(self.cache.get('key', tenant='globex'), 'globex')
+
+        cache.incr(GENERATION_KEY)  # a change not limited to a tenant
+        self.assertIsNone(self.cache.get('key', tenant='globex'))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_cache_keeping_nothing(self):
+        self.assertIsNone(bump_generation('acme'))
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_store_check(self):
+        self.assertEqual([error.id for error in check_generation_store(None)], ['rolez.W001'])
+        with override_settings(ROLE_GENERATION_STORE='database'):
+            self.assertEqual(check_generation_store(None), [])
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache'}}):
+            self.assertEqual(check_generation_store(None), [])
+
+
+@override_settings(ROLE_AUTHENTICATED_ROLES=['member'], ROLE_GENERATION_STORE='database')
+class CheckIntervalTests(ModelTestCase):
+    def setUp(self):
+        Role.objects.create(name='member').perms.add(Permission.objects.get(codename='add_blog'))
+        run_on_commit()
+        self.users = [UserModel.objects.create(username='user%s' % i) for i in range(5)]
+
+    def test_default_interval(self):
+        backend = RoleDefaultBackend()
+        self.assertIs(backend.has_perm(self.users[0], 'test_app.add_blog'), True)
+        with self.assertNumQueries(0):  # the generation is not read again
+            for user in self.users[1:]:
+                self.assertIs(backend.has_perm(user, 'test_app.add_blog'), True)
+
+
+@override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'])
+class ConcurrencyTests(TransactionTestCase):
+    def run_threads(self, *targets):
+        errors = []
+
+        def run(target):
+            try:
+                target()
+            except Exception as e:  # reported in the test thread
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_single_build(self):
+        cache = LocalCache()
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.05)
+            return frozenset(['built'])
+
+        values = []
+        self.run_threads(*[lambda: values.append(cache.get_or_build('key', build))] * 8)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(values, [frozenset(['built'])] * 8)
+
+    def test_stale_build_dropped(self):
+        cache = LocalCache()
+
+        def build():
+            cache.clear()  # the role graph changed while building
+            return 'old'
+
+        self.assertEqual(cache.get_or_build('key', build), 'old')
+        self.assertIsNone(cache.get('key'))
+
+    def test_has_perm_while_changing(self):
+        manager_role = Role.objects.create(name='manager')
+        manager_role.set_permissions(['test_app.change_author'])
+        user = get_user_model().objects.create(username='brandon')
+        user.user_permissions.add(manager_role.delegate)
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                reader = get_user_model().objects.get(pk=user.pk)
+                if not reader.has_role_perm('test_app.change_author'):
+                    raise AssertionError('role perm missing')
+                if reader.has_role_perm('test_app.add_blog'):
+                    raise AssertionError('unexpected perm')
+
+        def write():
+            # the role perms change while the readers rebuild; each change is seen right after
+            try:
+                for i in range(30):
+                    granted = i % 2 == 0
+                    manager_role.set_permissions(
+                        ['test_app.change_author'] + ['test_app.delete_author'] * granted)
+                    if i % 3 == 0:
+                        _get_cache().incr(GENERATION_KEY)  # another node
+                    writer = get_user_model().objects.get(pk=user.pk)
+                    if writer.has_role_perm('test_app.delete_author') is not granted:
+                        raise AssertionError('stale role perms after change %s' % i)
+            finally:
+                done.set()
+
+        self.run_threads(write, *[read] * 6)
@@ -1,10 +1,17 @@
 from django.contrib.auth.models import Permission, Group
-from django.db import IntegrityError
+from django.db import IntegrityError, connections, transaction
 from django.test import TestCase as ModelTestCase, override_settings  # use when querying models
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from unittest import TestCase as NonModelTestCase  # use otherwise
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
-from rolez.util import test_roles_for_perm, test_role_for_perm, get_role_model
+from django.core.signals import request_started
+from rolez.util import test_roles_for_perm, test_role_for_perm, get_role_model, get_read_db, \
+    get_roles_perms, get_role_index, unpin_primary
+from rolez.closure import RoleCycleError
+from rolez.models import RoleClosure
+from rolez.signals import role_changed
 from tests.test_app.models import Author, Blog
 
 UserModel = get_user_model()
@@ -45,6 +52,68 @@ class ModelTests(ModelTestCase):
             role.save()
 
 
+class SetPermissionsTests(ModelTestCase):
+    def setUp(self):
+        self.manager_role = Role.objects.create(name='manager')
+        self.author_role = Role.objects.create(name='author')
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        self.manager_role.perms.add(self.change_author)
+
+        self.events = []
+        role_changed.connect(self.receiver)
+
+    def tearDown(self):
+        role_changed.disconnect(self.receiver)
+
+    def receiver(self, sender, role, added, removed, **kwargs):
+        self.events.append((role, added, removed))
+
+    def get_perms(self, role):
+        return {perm.codename for perm in role.perms.all()}
+
+    def test_set_permissions(self):
+        added, removed = self.manager_role.set_permissions(
+            ['test_app.delete_author', 'test_app.add_blog', self.change_author])
+        self.assertEqual(added, {'test_app.delete_author', 'test_app.add_blog'})
+        self.assertEqual(removed, set())
+        self.assertEqual(self.get_perms(self.manager_role),
+                         {'change_author', 'delete_author', 'add_blog'})
+
+        self.manager_role.set_permissions(['test_app.add_blog'])
+        self.assertEqual(self.get_perms(self.manager_role), {'add_blog'})
+        self.assertEqual(self.events, [
+            (self.manager_role, {'test_app.delete_author', 'test_app.add_blog'}, set()),
+            (self.manager_role, set(), {'test_app.delete_author', 'test_app.change_author'}),
+        ])
+
+        self.assertEqual(self.manager_role.set_permissions(['test_app.add_blog']), (set(), set()))
+        self.assertEqual(len(self.events), 2)  # nothing changed
+
+    def test_set_permissions_unknown(self):
+        with self.assertRaises(Permission.DoesNotExist):
+            self.manager_role.set_permissions(['test_app.add_blog', 'test_app.fly_blog'])
+        self.assertEqual(self.get_perms(self.manager_role), {'change_author'})
+
+        for perms, entry in ((['add_blog'], "'add_blog'"), (['test_app.'], "'test_app.'"),
+                             ([None], 'None'), ([10 ** 9], '1000000000')):
+            with self.assertRaisesRegex(ValueError, entry):
+                self.manager_role.set_permissions(perms)
+        self.assertEqual(self.get_perms(self.manager_role), {'change_author'})
+
+    def test_set_permissions_nested(self):
+        self.manager_role.set_permissions([self.author_role.delegate])
+        self.assertEqual(list(RoleClosure.objects.values_list('ancestor', 'descendant')),
+                         [(self.manager_role.pk, self.author_role.pk)])
+
+        with self.assertRaises(RoleCycleError), transaction.atomic():
+            self.author_role.set_permissions([self.manager_role.delegate])
+
+        self.manager_role.set_permissions([])
+        self.assertEqual(RoleClosure.objects.count(), 0)
+
+
 class UtilityTests(ModelTestCase):
     def setUp(self):
         self.admins_group = Group.objects.create(name='admins')
@@ -96,3 +165,49 @@ class UtilityTests(ModelTestCase):
         self.assertIs(test_role_for_perm(self.manager_role.pk, 'test_app.change_author'), True)
         self.assertIs(test_role_for_perm(self.manager_role.pk, 'test_app.add_blog'), False)
 
+
+class ReadDatabaseTests(ModelTestCase):
+    def setUp(self):
+        self.manager_role = Role.objects.create(name='manager')
+        unpin_primary()
+
+    def test_default(self):
+        self.assertEqual(get_read_db(), 'default')
+
+    @override_settings(ROLE_READ_DATABASE='replica')
+    def test_read_database(self):
+        self.assertEqual(get_read_db(), 'replica')
+        self.assertEqual(get_roles_perms([self.manager_role.pk]).db, 'replica')
+
+    @override_settings(ROLE_READ_DATABASE='replica')
+    def test_pin_primary_after_change(self):
+        content_type = ContentType.objects.get_for_model(Author)
+        self.manager_role.perms.add(
+            Permission.objects.get(content_type=content_type, codename='change_author'))
+        self.assertEqual(get_read_db(), 'default')
+        self.assertEqual(get_roles_perms([self.manager_role.pk]).db, 'default')
+
+        request_started.send(sender=self.__class__)  # next request
+        self.assertEqual(get_read_db(), 'replica')
+
+    @override_settings(ROLE_READ_DATABASE='replica', ROLE_PRIMARY_PIN_SECONDS=0)
+    def test_pin_times_out(self):
+        self.manager_role.perms.add(Permission.objects.get(codename='change_author'))
+        self.assertEqual(get_read_db(), 'replica')  # no request to end it, as in a worker
+
+
+class ReadDatabaseQueryTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.manager_role = Role.objects.create(name='manager')
+        self.manager_role.perms.add(Permission.objects.get(codename='change_author'))
+        unpin_primary()
+
+    @override_settings(ROLE_READ_DATABASE='replica')
+    def test_queries(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertIs(test_roles_for_perm([self.manager_role], 'test_app.change_author'), True)
+            self.assertEqual(get_role_index()['test_app.use_role_manager'],
+                             {'test_app.change_author'})
+        self.assertEqual(len(replica), 3)  # the exists and the role index
@@ -0,0 +1,100 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.db import connection
+from django.test import TestCase as ModelTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rolez.prefetch import prefetch_role_permissions
+from rolez.util import get_role_model, get_all_perms
+from rolez.testing import run_on_commit
+from tests.test_app.models import Author, Blog
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+class PrefetchRolePermissionsTests(ModelTestCase):
+    def setUp(self):
+        self.admins_group = Group.objects.create(name='admins')
+
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.jack = UserModel.objects.create(username='jack')
+        self.mark = UserModel.objects.create(username='mark', is_superuser=True)
+        self.brandon.groups.add(self.admins_group)
+
+        self.admin_role = Role.objects.create(name='admin')  # manager
+        self.manager_role = Role.objects.create(name='manager')  # author change
+
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        content_type = ContentType.objects.get_for_model(Blog)
+        self.add_blog = Permission.objects.get(content_type=content_type, codename='add_blog')
+
+        self.manager_role.perms.add(self.change_author)
+        self.admin_role.perms.add(self.manager_role.delegate)
+
+        self.brandon.user_permissions.add(self.add_blog)
+        self.admins_group.permissions.add(self.manager_role.delegate)
+        self.jack.user_permissions.add(self.admin_role.delegate)
+        self.jack.roles.add(self.manager_role)
+
+        for i in range(5):
+            user = UserModel.objects.create(username='user%s' % i)
+            user.user_permissions.add(self.admin_role.delegate)
+        run_on_commit()
+
+    def users(self, *usernames):
+        return UserModel.objects.filter(username__in=usernames).order_by('username')
+
+    def assert_same(self, prefetched, methods):
+        with self.assertNumQueries(0):
+            results = [[getattr(user, method)() for method in methods] for user in prefetched]
+        expected = [[getattr(user, method)() for method in methods]
+                    for user in self.users(*[user.username for user in prefetched])]
+        self.assertEqual(results, expected)
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'rolez.backend.RoleModelBackend',
+        ],
+    )
+    def test_backends(self):
+        users = prefetch_role_permissions(self.users('brandon', 'jack', 'mark'))
+        self.assert_same(users, ['get_group_permissions', 'get_all_permissions'])
+        with self.assertNumQueries(0):
+            self.assertTrue(users[0].has_perm('test_app.change_author'))  # brandon
+            self.assertTrue(users[1].has_perms(['test_app.change_author',
+                                                'test_app.use_role_manager']))  # jack
+            self.assertFalse(users[1].has_perm('test_app.add_blog'))
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'])
+    def test_mixin(self):
+        users = prefetch_role_permissions(self.users('brandon', 'jack', 'mark'))
+        self.assert_same(users, ['get_all_role_perms', 'get_group_role_perms'])
+        with self.assertNumQueries(0):
+            self.assertTrue(users[0].has_role_perm('test_app.change_author'))
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'rolez.backend.RoleDefaultBackend',
+        ],
+        ROLE_AUTHENTICATED_ROLES=['member'],
+    )
+    def test_default_roles(self):
+        member_role = Role.objects.create(name='member')
+        member_role.perms.add(Permission.objects.get(codename='view_blog'))
+        users = prefetch_role_permissions(self.users('brandon', 'jack'))
+        self.assertIn('test_app.view_blog', users[0].get_all_role_perms())
+        self.assert_same(users, ['get_all_role_perms'])
+
+    def test_fixed_queries(self):
+        get_all_perms()  # process wide
+        with CaptureQueriesContext(connection) as few:
+            prefetch_role_permissions(self.users('brandon', 'mark'))
+        with CaptureQueriesContext(connection) as many:
+            prefetch_role_permissions(UserModel.objects.all())
+        self.assertEqual(len(many), len(few))
@@ -0,0 +1,174 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.db import connection, connections
+from django.test import TestCase as ModelTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import generics, serializers
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from guardian.shortcuts import assign_perm
+from rolez.prefetch import has_prefetched_perms, prefetch_role_obj_perms
+from rolez.rest_framework import RoleObjectPermissions, RoleObjectPermissionsFilter, \
+    RolePermissionsMixin
+from rolez.scope import assign_scoped_role
+from rolez.util import get_role_model, unpin_primary
+from tests.test_app.models import Blog
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+class BlogSerializer(serializers.ModelSerializer):
+    can_change = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Blog
+        fields = ('id', 'name', 'can_change')
+
+    def get_can_change(self, obj):
+        return has_prefetched_perms(self.context['request'].user, ['test_app.change_blog'], obj)
+
+
+class Pagination(PageNumberPagination):
+    page_size = 10
+
+
+class BlogList(RolePermissionsMixin, generics.ListAPIView):
+    queryset = Blog.objects.order_by('pk')
+    serializer_class = BlogSerializer
+    permission_classes = [RoleObjectPermissions]
+    filter_backends = [RoleObjectPermissionsFilter]
+    pagination_class = Pagination
+    prefetch_perms = ['test_app.change_blog']
+
+
+class FilteredBlogList(generics.ListAPIView):
+    queryset = Blog.objects.order_by('pk')
+    serializer_class = BlogSerializer
+    permission_classes = []
+    filter_backends = [RoleObjectPermissionsFilter]
+
+
+class RoleObjectPermissionsOnly(RoleObjectPermissions):
+    object_perms_only = True
+
+
+class BlogDetail(generics.RetrieveUpdateAPIView):
+    queryset = Blog.objects.all()
+    serializer_class = BlogSerializer
+    permission_classes = [RoleObjectPermissionsOnly]
+    filter_backends = [RoleObjectPermissionsFilter]
+
+
+class StrictBlogDetail(BlogDetail):
+    permission_classes = [RoleObjectPermissions]
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'guardian.backends.ObjectPermissionBackend',
+        'rolez.backend.RoleScopeBackend',
+    ],
+)
+class RestFrameworkTests(ModelTestCase):
+    def setUp(self):
+        self.users_group = Group.objects.create(name='users')
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.jack = UserModel.objects.create(username='jack')
+        self.jack.groups.add(self.users_group)
+
+        self.editor_role = Role.objects.create(name='editor')  # blog view, change
+
+        content_type = ContentType.objects.get_for_model(Blog)
+        self.view_blog = Permission.objects.get(content_type=content_type, codename='view_blog')
+        self.change_blog = Permission.objects.get(content_type=content_type, codename='change_blog')
+        self.editor_role.perms.add(self.view_blog, self.change_blog)
+
+        self.blogs = [Blog.objects.create(name='blog %s' % i) for i in range(4)]
+        assign_scoped_role(self.editor_role, self.users_group, self.blogs[0])
+        assign_scoped_role(self.editor_role, self.jack, self.blogs[1])
+        assign_perm(self.view_blog, self.jack, self.blogs[3])  # no role, view only
+
+        self.factory = APIRequestFactory()
+
+    def get(self, view, user, **kwargs):
+        request = self.factory.get('/')
+        force_authenticate(request, user=UserModel.objects.get(pk=user.pk))
+        return view.as_view()(request, **kwargs)
+
+    def test_list(self):
+        response = self.get(BlogList, self.jack)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(blog['name'], blog['can_change']) for blog in response.data['results']],
+                         [('blog 0', True), ('blog 1', True), ('blog 3', False)])
+
+        response = self.get(BlogList, self.brandon)
+        self.assertEqual(response.data['results'], [])
+
+    def test_prefetched_denial_not_final(self):
+        jack = UserModel.objects.get(pk=self.jack.pk)
+        prefetch_role_obj_perms(jack, ['test_app.change_blog'], [self.blogs[3]])
+        assign_perm(self.change_blog, jack, self.blogs[3])  # after prefetching
+        self.assertTrue(has_prefetched_perms(jack, ['test_app.change_blog'], self.blogs[3]))
+
+    def test_list_queries_bounded(self):
+        with CaptureQueriesContext(connection) as small_page:
+            self.get(BlogList, self.jack)
+        for i in range(5):
+            blog = Blog.objects.create(name='more %s' % i)
+            assign_scoped_role(self.editor_role, self.users_group, blog)
+        with CaptureQueriesContext(connection) as large_page:
+            response = self.get(BlogList, self.jack)
+        self.assertEqual(len(response.data['results']), 8)
+        self.assertEqual(len(large_page), len(small_page))
+
+    def patch(self, view, user, **kwargs):
+        request = self.factory.patch('/', {'name': 'renamed'}, format='json')
+        force_authenticate(request, user=UserModel.objects.get(pk=user.pk))
+        return view.as_view()(request, **kwargs)
+
+    def test_detail(self):
+        response = self.patch(StrictBlogDetail, self.jack, pk=self.blogs[1].pk)
+        self.assertEqual(response.status_code, 403)  # no model perm
+
+        response = self.patch(BlogDetail, self.jack, pk=self.blogs[1].pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Blog.objects.get(pk=self.blogs[1].pk).name, 'renamed')
+
+        response = self.patch(BlogDetail, self.jack, pk=self.blogs[3].pk)
+        self.assertEqual(response.status_code, 403)  # can view, not change
+
+        self.users_group.permissions.add(self.change_blog)
+        response = self.patch(StrictBlogDetail, self.jack, pk=self.blogs[1].pk)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.get(BlogDetail, self.jack, pk=self.blogs[2].pk)
+        self.assertEqual(response.status_code, 404)
+
+
+class ReadDatabaseTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.jack = UserModel.objects.create(username='jack')
+        editor_role = Role.objects.create(name='editor')
+        editor_role.perms.add(Permission.objects.get(codename='view_blog'))
+        self.blogs = [Blog.objects.create(name='blog %s' % i) for i in range(3)]
+        assign_scoped_role(editor_role, self.jack, self.blogs[0])
+        assign_perm('test_app.view_blog', self.jack, self.blogs[2])
+        unpin_primary()  # the role changes are in
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'],
+        ROLE_READ_DATABASE='replica',
+    )
+    def test_filter(self):
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.jack)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = FilteredBlogList.as_view()(request)
+        self.assertEqual([blog['name'] for blog in response.data], ['blog 0', 'blog 2'])
+        self.assertEqual(len(replica), 1)  # the list, with its subqueries
@@ -0,0 +1,155 @@
+import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.test import TestCase as ModelTestCase, override_settings
+
+from rolez.backend import RoleScopeBackend
+from rolez.models import RoleAssignment
+from rolez.scope import assign_scoped_role, remove_scoped_role, filter_by_scoped_role_perm, \
+    get_scope_relations
+from rolez.util import clear_cache, get_role_model
+from tests.test_app.models import Blog, Entry
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+def create_entry(blog, headline):
+    today = datetime.date.today()
+    return Entry.objects.create(blog=blog, headline=headline, body_text='', pub_date=today,
+                                mod_date=today, n_comments=0, n_pingbacks=0, rating=0,
+                                status=0)
+
+
+class ScopeTestsCommon(object):
+    def setUp(self):
+        self.users_group = Group.objects.create(name='users')
+
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.jack = UserModel.objects.create(username='jack')
+        self.jack.groups.add(self.users_group)
+
+        self.editor_role = Role.objects.create(name='editor')  # blog, entry change
+
+        blog_ct = ContentType.objects.get_for_model(Blog)
+        entry_ct = ContentType.objects.get_for_model(Entry)
+        self.change_blog = Permission.objects.get(content_type=blog_ct, codename='change_blog')
+        self.change_entry = Permission.objects.get(content_type=entry_ct, codename='change_entry')
+        self.editor_role.perms.add(self.change_blog, self.change_entry)
+
+        self.twain_blog = Blog.objects.create(name="twain personal blog")
+        self.other_blog = Blog.objects.create(name="other blog")
+        self.twain_entry = create_entry(self.twain_blog, 'twain entry')
+        self.other_entry = create_entry(self.other_blog, 'other entry')
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'rolez.backend.RoleScopeBackend',
+    ],
+)
+class RoleScopeBackendTests(ScopeTestsCommon, ModelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = RoleScopeBackend()
+
+    def test_scope_relations(self):
+        self.assertEqual(get_scope_relations(Entry), [(Blog, 'blog', False)])
+        self.assertEqual(get_scope_relations(Blog), [])
+
+    def test_user_allow_scoped_role(self):
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_blog', self.twain_blog),
+                      False)
+
+        assign_scoped_role(self.editor_role, self.brandon, self.twain_blog)
+        clear_cache(self.brandon)
+
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_blog', self.twain_blog),
+                      True)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.use_role_editor',
+                                            self.twain_blog), True)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.delete_blog', self.twain_blog),
+                      False)  # not in role
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_blog', self.other_blog),
+                      False)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_blog'), False)
+        self.assertIs(self.brandon.has_perm('test_app.change_blog', self.twain_blog), True)
+
+        remove_scoped_role(self.editor_role, self.brandon, self.twain_blog)
+        clear_cache(self.brandon)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_blog', self.twain_blog),
+                      False)
+
+    def test_inherited_scoped_role(self):
+        assign_scoped_role(self.editor_role, self.brandon, self.twain_blog)
+
+        with self.assertNumQueries(1):
+            self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_entry',
+                                                self.twain_entry), True)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_entry',
+                                            self.other_entry), False)
+
+    def test_group_allow_scoped_role(self):
+        assign_scoped_role(self.editor_role, self.users_group, self.twain_blog)
+
+        self.assertIs(self.backend.has_perm(self.jack, 'test_app.change_entry', self.twain_entry),
+                      True)
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_entry',
+                                            self.twain_entry), False)
+
+    def test_filter_by_scoped_role_perm(self):
+        assign_scoped_role(self.editor_role, self.brandon, self.twain_blog)
+        assign_scoped_role(self.editor_role, self.jack, self.other_entry)
+
+        entries = filter_by_scoped_role_perm(self.brandon, 'test_app.change_entry',
+                                             Entry.objects.all())
+        self.assertEqual(list(entries), [self.twain_entry])
+
+        entries = filter_by_scoped_role_perm(self.jack, self.change_entry, Entry.objects.all())
+        self.assertEqual(list(entries), [self.other_entry])
+
+        blogs = filter_by_scoped_role_perm(self.jack, 'test_app.change_blog', Blog.objects.all())
+        self.assertEqual(list(blogs), [])
+
+    def test_inactive_user(self):
+        assign_scoped_role(self.editor_role, self.brandon, self.twain_blog)
+        self.brandon.is_active = False
+        self.assertIs(self.backend.has_perm(self.brandon, 'test_app.change_blog', self.twain_blog),
+                      False)
+        self.assertIs(self.brandon.has_role_perm('test_app.change_blog', self.twain_blog), False)
+        entries = filter_by_scoped_role_perm(self.brandon, 'test_app.change_entry',
+                                             Entry.objects.all())
+        self.assertEqual(list(entries), [])
+
+    def test_assignment_constraints(self):
+        assignment = assign_scoped_role(self.editor_role, self.brandon, self.twain_blog)
+        fields = {'role': self.editor_role, 'content_type': assignment.content_type,
+                  'object_pk': assignment.object_pk}
+        for principals in ({'user': self.brandon}, {'user': self.jack, 'group': self.users_group},
+                           {}):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                RoleAssignment.objects.create(**fields, **principals)
+
+        with self.assertRaises(ValidationError):
+            RoleAssignment(**fields).clean()
+        assign_scoped_role(self.editor_role, self.users_group, self.twain_blog)
+        self.assertEqual(assign_scoped_role(self.editor_role, self.users_group,
+                                            self.twain_blog).group, self.users_group)
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+    ],
+)
+class UserRoleMixinScopeTests(ScopeTestsCommon, ModelTestCase):
+    def test_mixin_allow_scoped_role(self):
+        assign_scoped_role(self.editor_role, self.brandon, self.twain_blog)
+
+        self.assertIs(self.brandon.has_role_perm('test_app.change_entry', self.twain_entry), True)
+        self.assertIs(self.brandon.has_role_perm('test_app.change_entry', self.other_entry), False)
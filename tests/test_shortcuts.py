@@ -0,0 +1,164 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.test import TestCase as ModelTestCase, override_settings
+
+from rolez.generation import get_generation
+from rolez.shortcuts import assign_role, revoke_role, get_users_with_role_perm, \
+    iter_users_with_role_perm
+from rolez.signals import role_assignment_changed
+from rolez.util import get_role_model
+from rolez.testing import run_on_commit
+from tests.test_app.models import Author
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'rolez.backend.RoleModelBackend',
+    ],
+)
+class AssignRoleTests(ModelTestCase):
+    def setUp(self):
+        self.users = [UserModel.objects.create(username='user%s' % i) for i in range(20)]
+        self.brandon = self.users[0]
+
+        self.manager_role = Role.objects.create(name='manager')  # author change
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        self.manager_role.perms.add(self.change_author)
+
+        self.events = []
+        role_assignment_changed.connect(self.receiver)
+
+    def tearDown(self):
+        role_assignment_changed.disconnect(self.receiver)
+
+    def receiver(self, sender, **kwargs):
+        self.events.append((kwargs['action'], sorted(kwargs['user_pks'])))
+
+    def test_assign_revoke_queryset(self):
+        users = UserModel.objects.filter(username__startswith='user')  # not guardian's anonymous
+        self.brandon.user_permissions.add(self.manager_role.delegate)  # already has it
+
+        with self.assertNumQueries(5):  # existing, pks and insert in a savepoint
+            self.assertEqual(assign_role(self.manager_role, users), 19)
+        self.assertEqual(self.events, [('assign', [user.pk for user in self.users[1:]])])
+        self.assertEqual(UserModel.objects.filter(
+            user_permissions=self.manager_role.delegate).count(), 20)
+
+        self.assertEqual(revoke_role(self.manager_role, users.exclude(pk=self.brandon.pk)), 19)
+        self.assertEqual(list(UserModel.objects.filter(
+            user_permissions=self.manager_role.delegate)), [self.brandon])
+
+    def test_assign_revoke_instances(self):
+        self.assertIs(self.brandon.has_perm('test_app.change_author'), False)  # fills caches
+
+        generation = get_generation()
+        self.assertEqual(assign_role(self.manager_role, self.users[:2]), 2)
+        run_on_commit()
+        self.assertNotEqual(get_generation(), generation)
+        self.assertIs(self.brandon.has_perm('test_app.change_author'), True)  # caches cleared
+
+        self.assertEqual(assign_role(self.manager_role, [self.brandon.pk]), 0)
+        self.assertEqual(len(self.events), 1)  # nothing changed
+
+        self.assertEqual(revoke_role(self.manager_role, self.users[:2]), 2)
+        run_on_commit()
+        self.assertIs(self.brandon.has_perm('test_app.change_author'), False)
+
+    def test_assign_revoke_chunks(self):
+        users = (user for user in self.users[:5])  # iterated once
+        self.assertEqual(assign_role(self.manager_role, users, chunk_size=2), 5)
+        self.assertEqual(UserModel.objects.filter(
+            user_permissions=self.manager_role.delegate).count(), 5)
+        self.assertEqual(assign_role(self.manager_role, self.users[:7], chunk_size=2), 2)
+
+        pks = (user.pk for user in self.users)
+        self.assertEqual(revoke_role(self.manager_role, pks, chunk_size=3), 7)
+        self.assertEqual(self.events[-1], ('revoke', [user.pk for user in self.users[:7]]))
+
+    def test_assign_revoke_roles(self):
+        assign_role(self.manager_role, self.users[:3], field='roles')
+        self.assertEqual(list(self.manager_role.users.all()), self.users[:3])
+        self.assertEqual(self.brandon.user_permissions.count(), 0)
+
+        revoke_role(self.manager_role, UserModel.objects.all(), field='roles')
+        self.assertEqual(self.manager_role.users.count(), 0)
+
+
+class UsersWithRolePermTests(ModelTestCase):
+    def setUp(self):
+        self.admins_group = Group.objects.create(name='admins')
+        self.users_group = Group.objects.create(name='users')
+
+        self.direct = UserModel.objects.create(username='direct')
+        self.grouped = UserModel.objects.create(username='grouped')
+        self.delegated = UserModel.objects.create(username='delegated')
+        self.group_delegated = UserModel.objects.create(username='group_delegated')
+        self.nested = UserModel.objects.create(username='nested')
+        self.listed = UserModel.objects.create(username='listed')
+        self.nobody = UserModel.objects.create(username='nobody')
+        self.boss = UserModel.objects.create(username='boss', is_superuser=True)
+
+        self.admin_role = Role.objects.create(name='admin')  # manager
+        self.manager_role = Role.objects.create(name='manager')  # author change
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        self.manager_role.perms.add(self.change_author)
+        self.admin_role.perms.add(self.manager_role.delegate)
+
+        self.direct.user_permissions.add(self.change_author)
+        self.grouped.groups.add(self.admins_group)
+        self.admins_group.permissions.add(self.change_author)
+        self.delegated.user_permissions.add(self.manager_role.delegate)
+        self.group_delegated.groups.add(self.users_group)
+        self.users_group.permissions.add(self.manager_role.delegate)
+        self.nested.user_permissions.add(self.admin_role.delegate)
+        self.listed.roles.add(self.manager_role)
+
+        self.holders = {self.direct, self.grouped, self.delegated, self.group_delegated,
+                        self.nested, self.listed}
+
+    def test_get_users_with_role_perm(self):
+        with self.assertNumQueries(1):
+            users = set(get_users_with_role_perm('test_app.change_author'))
+        self.assertEqual(users, self.holders)
+
+        self.assertEqual(set(get_users_with_role_perm(self.change_author, with_superusers=True)),
+                         self.holders | {self.boss})
+        self.assertEqual(set(get_users_with_role_perm('test_app.use_role_manager')),
+                         {self.delegated, self.group_delegated, self.nested})
+        self.assertEqual(set(get_users_with_role_perm('test_app.add_blog')), set())
+
+    def test_inactive_users(self):
+        self.direct.is_active = False
+        self.direct.save()
+        self.assertNotIn(self.direct, get_users_with_role_perm('test_app.change_author'))
+        self.assertIn(self.direct, get_users_with_role_perm('test_app.change_author',
+                                                            only_active=False))
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'rolez.backend.RoleDefaultBackend',
+        ],
+        ROLE_AUTHENTICATED_ROLES=['admin'],
+    )
+    def test_default_roles(self):
+        run_on_commit()
+        self.nobody.is_active = False
+        self.nobody.save()
+        everyone = set(UserModel.objects.exclude(pk=self.nobody.pk))
+        self.assertEqual(set(get_users_with_role_perm('test_app.change_author')), everyone)
+        self.assertEqual(set(get_users_with_role_perm(self.manager_role.delegate)), everyone)
+        self.assertEqual(set(get_users_with_role_perm('test_app.add_author')), set())
+
+    def test_iter_users_with_role_perm(self):
+        users = list(iter_users_with_role_perm('test_app.change_author', chunk_size=2))
+        self.assertEqual(users, sorted(self.holders, key=lambda user: user.pk))
@@ -0,0 +1,83 @@
+import pickle
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.test import TestCase as ModelTestCase, override_settings
+
+from rolez.snapshot import get_snapshot, FrozenPrincipal, StaleSnapshot, dumps, loads
+from rolez.util import get_role_model
+from rolez.testing import run_on_commit
+from tests.test_app.models import Author
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'rolez.backend.RoleModelBackend',
+    ],
+)
+class SnapshotTests(ModelTestCase):
+    def setUp(self):
+        self.admins_group = Group.objects.create(name='admins')
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.brandon.groups.add(self.admins_group)
+
+        self.manager_role = Role.objects.create(name='manager')  # author change, delete
+
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        self.delete_author = Permission.objects.get(
+            content_type=content_type, codename='delete_author')
+        self.manager_role.perms.add(self.change_author, self.delete_author)
+
+        self.admins_group.permissions.add(self.manager_role.delegate)
+
+    def test_snapshot_round_trip(self):
+        principal = loads(dumps(self.brandon))
+        self.assertEqual(principal.pk, self.brandon.pk)
+        self.assertEqual(principal.get_all_permissions(),
+                         {'test_app.use_role_manager', 'test_app.change_author',
+                          'test_app.delete_author'})
+
+        principal = pickle.loads(pickle.dumps(principal))
+
+        with self.assertNumQueries(0):
+            self.assertIs(principal.has_perm('test_app.change_author'), True)
+            self.assertIs(principal.has_perm('test_app.add_blog'), False)
+            self.assertIs(principal.has_perm('test_app.change_author', object()), False)
+            self.assertIs(principal.has_perms(['test_app.change_author',
+                                               'test_app.delete_author']), True)
+            self.assertIs(principal.has_module_perms('test_app'), True)
+            self.assertIs(principal.has_module_perms('auth'), False)
+
+    def test_snapshot_compact(self):
+        snapshot = get_snapshot(self.brandon)
+        self.assertEqual(snapshot['perms'], {
+            'test_app': ['change_author', 'delete_author', 'use_role_manager']})
+
+        self.brandon.is_superuser = True
+        snapshot = get_snapshot(self.brandon)
+        self.assertEqual(snapshot['perms'], {})
+        self.assertIs(FrozenPrincipal.from_snapshot(snapshot).has_perm('auth.add_user'), True)
+
+    def test_stale_snapshot(self):
+        data = dumps(self.brandon)
+        self.manager_role.perms.remove(self.delete_author)
+        run_on_commit()
+
+        with self.assertRaises(StaleSnapshot):
+            loads(data)
+
+        principal = loads(data, check_generation=False)
+        self.assertIs(principal.has_perm('test_app.delete_author'), True)
+
+    def test_inactive(self):
+        self.brandon.is_active = False
+        principal = loads(dumps(self.brandon))
+        self.assertIs(principal.has_perm('test_app.change_author'), False)
+        self.assertIs(principal.has_module_perms('test_app'), False)
@@ -0,0 +1,84 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group, AnonymousUser
+from django.db import connection
+from django.template import Template, RequestContext
+from django.test import TestCase as ModelTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from guardian.shortcuts import assign_perm
+from rolez.scope import assign_scoped_role
+from rolez.util import get_role_model
+from tests.test_app.models import Author, Blog
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=[
+        'django.contrib.auth.backends.ModelBackend',
+        'guardian.backends.ObjectPermissionBackend',
+    ],
+)
+class TemplateTests(ModelTestCase):
+    def setUp(self):
+        self.users_group = Group.objects.create(name='users')
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.jack = UserModel.objects.create(username='jack')
+        self.jack.groups.add(self.users_group)
+
+        self.manager_role = Role.objects.create(name='manager')  # author change, delete
+        self.editor_role = Role.objects.create(name='editor')  # blog change
+
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        self.delete_author = Permission.objects.get(
+            content_type=content_type, codename='delete_author')
+        content_type = ContentType.objects.get_for_model(Blog)
+        self.change_blog = Permission.objects.get(content_type=content_type, codename='change_blog')
+
+        self.manager_role.perms.add(self.change_author, self.delete_author)
+        self.editor_role.perms.add(self.change_blog)
+        self.brandon.user_permissions.add(self.manager_role.delegate)
+
+        self.blogs = [Blog.objects.create(name='blog %s' % i) for i in range(4)]
+
+    def render(self, source, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return Template(source).render(RequestContext(request, {'blogs': self.blogs}))
+
+    def test_perm_lookups(self):
+        source = '{{ perms.test_app.change_author }} {{ perms.test_app.add_blog }} ' \
+                 '{% if "test_app.delete_author" in perms %}delete{% endif %} ' \
+                 '{% if perms.test_app %}app{% endif %} {% if perms.auth %}auth{% endif %}'
+        self.assertEqual(self.render(source, self.brandon), 'True False delete app ')
+        self.assertEqual(self.render(source, AnonymousUser()), 'False False   ')
+
+    def test_perms_loaded_once(self):
+        self.render('{{ perms.test_app.change_author }}', self.brandon)  # shared role index
+        self.brandon = UserModel.objects.get(pk=self.brandon.pk)
+        with CaptureQueriesContext(connection) as single:
+            self.render('{{ perms.test_app.change_author }}', self.brandon)
+        self.brandon = UserModel.objects.get(pk=self.brandon.pk)  # no instance caches
+        with CaptureQueriesContext(connection) as many:
+            self.render('{{ perms.test_app.change_author }}{{ perms.test_app.delete_author }}'
+                        '{{ perms.test_app.add_blog }}{{ perms.test_app }}', self.brandon)
+        self.assertEqual(len(many), len(single))
+
+    def test_objects_with_role_perm(self):
+        assign_scoped_role(self.editor_role, self.users_group, self.blogs[1])
+        assign_perm(self.change_blog, self.jack, self.blogs[3])  # not through a role
+
+        source = '{% load rolez_tags %}' \
+                 '{% objects_with_role_perm user "test_app.change_blog" blogs as editable %}' \
+                 '{% for blog in blogs %}{% if blog.pk in editable %}{{ forloop.counter0 }}' \
+                 '{% endif %}{% endfor %}'
+        with self.assertNumQueries(3):  # guardian user and group perms, scoped roles
+            self.assertEqual(self.render(source, self.jack), '13')
+        self.assertEqual(self.render(source, self.brandon), '')
+
+        self.brandon.is_superuser = True
+        self.assertEqual(self.render(source, self.brandon), '0123')
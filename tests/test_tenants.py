@@ -0,0 +1,100 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import IntegrityError, transaction
+from django.test import TestCase as ModelTestCase, override_settings
+from unittest import skipUnless
+
+from rolez.backend import RoleDefaultBackend
+from rolez.closure import RoleTenantError
+from rolez.models import AbstractTenantRole
+from rolez.testing import run_on_commit
+from rolez.util import get_role_model, get_role_index, get_tenant
+from tests.test_app.models import Author
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+@skipUnless(issubclass(Role, AbstractTenantRole), 'runs with tests.settings_tenant')
+@override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'])
+class TenantRoleTests(ModelTestCase):
+    def setUp(self):
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        self.delete_author = Permission.objects.get(
+            content_type=content_type, codename='delete_author')
+
+        self.acme_manager = Role.objects.create(tenant='Acme', name='manager')
+        self.globex_manager = Role.objects.create(tenant='globex', name='manager')
+        self.member_role = Role.objects.create(name='member')  # shared
+        self.acme_manager.perms.add(self.change_author)
+        self.globex_manager.perms.add(self.delete_author)
+
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.brandon.role_tenant = 'Acme'
+        self.brandon.user_permissions.add(self.acme_manager.delegate)
+        run_on_commit()
+
+    def test_names_per_tenant(self):
+        self.assertEqual(self.acme_manager.delegate.codename, 'use_role_Acme:manager')
+        self.assertEqual(self.globex_manager.delegate.codename, 'use_role_globex:manager')
+        self.assertEqual(self.member_role.delegate.codename, 'use_role_member')
+        self.assertEqual(self.acme_manager.delegate.name, 'Can use role manager of Acme')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Role.objects.create(tenant='Acme', name='manager')
+
+        # no shared or other tenant name maps to the same delegate
+        self.assertEqual(Role.objects.create(name='Acme manager').delegate.codename,
+                         'use_role_acme_manager')
+        self.assertEqual(Role.objects.create(tenant='Acme', name='a:manager').delegate.codename,
+                         'use_role_Acme:amanager')
+
+    def test_nesting_within_tenant(self):
+        self.acme_manager.perms.add(self.member_role.delegate)  # shared
+        with self.assertRaises(RoleTenantError), transaction.atomic():
+            self.acme_manager.perms.add(self.globex_manager.delegate)
+        with self.assertRaises(RoleTenantError), transaction.atomic():
+            self.member_role.set_permissions([self.globex_manager.delegate])
+        self.assertEqual(set(self.member_role.perms.all()), set())
+
+    def test_role_index(self):
+        index = get_role_index('Acme')
+        self.assertEqual(index['test_app.use_role_Acme:manager'], {'test_app.change_author'})
+        self.assertNotIn('test_app.use_role_globex:manager', index)
+        self.assertIn('test_app.use_role_globex:manager', get_role_index())
+
+    def test_move_to_other_tenant(self):
+        self.assertIn('test_app.use_role_Acme:manager', get_role_index('Acme'))
+        self.acme_manager.tenant = 'initech'
+        self.acme_manager.save()
+        run_on_commit()
+        self.assertNotIn('test_app.use_role_Acme:manager', get_role_index('Acme'))
+
+    def test_get_tenant(self):
+        self.assertEqual(get_tenant(self.brandon), 'Acme')
+        self.assertIsNone(get_tenant(UserModel(username='jack')))
+
+    def test_other_tenant_change(self):
+        self.assertTrue(self.brandon.has_role_perm('test_app.change_author'))
+        self.globex_manager.perms.add(self.change_author)
+        run_on_commit()
+        brandon = UserModel.objects.get(pk=self.brandon.pk)
+        brandon.role_tenant = 'Acme'
+        with self.assertNumQueries(2):  # user and group perms; the index of acme is kept
+            self.assertTrue(brandon.has_role_perm('test_app.change_author'))
+
+        self.acme_manager.perms.remove(self.change_author)
+        run_on_commit()
+        brandon = UserModel.objects.get(pk=self.brandon.pk)
+        brandon.role_tenant = 'Acme'
+        self.assertFalse(brandon.has_role_perm('test_app.change_author'))
+
+    @override_settings(ROLE_AUTHENTICATED_ROLES=['manager', 'member'])
+    def test_default_roles(self):
+        self.assertEqual(RoleDefaultBackend().get_all_permissions(self.brandon), {
+            'test_app.use_role_Acme:manager', 'test_app.change_author',
+            'test_app.use_role_member'})
+        self.assertEqual(RoleDefaultBackend().get_all_permissions(UserModel(username='jack')),
+                         {'test_app.use_role_member'})
@@ -0,0 +1,113 @@
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model, models as auth_models
+from django.contrib.auth.models import Permission, Group
+from django.test import TestCase as ModelTestCase, override_settings
+
+import rolez
+from rolez.scope import assign_scoped_role
+from rolez.tracing import get_trace, step
+from rolez.util import get_role_model
+from tests.test_app.models import Author, Blog
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+class TraceTests(ModelTestCase):
+    def setUp(self):
+        self.users_group = Group.objects.create(name='users')
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.jack = UserModel.objects.create(username='jack')
+        self.jack.groups.add(self.users_group)
+
+        self.manager_role = Role.objects.create(name='manager')  # author change, delete
+        self.editor_role = Role.objects.create(name='editor')  # blog change
+
+        content_type = ContentType.objects.get_for_model(Author)
+        self.manager_role.perms.add(
+            Permission.objects.get(content_type=content_type, codename='change_author'),
+            Permission.objects.get(content_type=content_type, codename='delete_author'))
+        content_type = ContentType.objects.get_for_model(Blog)
+        self.editor_role.perms.add(
+            Permission.objects.get(content_type=content_type, codename='change_blog'))
+        self.brandon.user_permissions.add(self.manager_role.delegate)
+
+        self.blog = Blog.objects.create(name='twain personal blog')
+        assign_scoped_role(self.editor_role, self.users_group, self.blog)
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'rolez.backend.RoleModelBackend',
+        ],
+    )
+    def test_backends(self):
+        with rolez.trace() as t:
+            self.assertTrue(self.brandon.has_perm('test_app.change_author'))
+            self.assertTrue(self.brandon.has_perm('test_app.delete_author'))
+
+        first, second = t.checks
+        self.assertEqual((first.name, first.detail['perm'], first.result),
+                         ('has_perm', 'test_app.change_author', True))
+        self.assertEqual([(backend.name, backend.result) for backend in first.children],
+                         [('ModelBackend', False), ('RoleModelBackend', True)])
+        self.assertGreater(len(first.queries), 0)
+
+        self.assertEqual(len(second.queries), 0)
+        self.assertIn('cache hit', [child.name for child in second.children[1].children])
+        self.assertIn('RoleModelBackend: True', str(t))
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'rolez.backend.RoleModelBackend',
+        ],
+    )
+    def test_other_entry_points(self):
+        with rolez.trace() as t:
+            self.assertTrue(self.brandon.has_module_perms('test_app'))
+            self.assertIn('test_app.change_author', self.brandon.get_all_permissions())
+
+        module_perms, all_perms = t.checks
+        self.assertEqual((module_perms.name, module_perms.detail['app_label'], module_perms.result),
+                         ('has_module_perms', 'test_app', True))
+        self.assertEqual(all_perms.name, 'get_all_permissions')
+        self.assertEqual([backend.name for backend in all_perms.children],
+                         ['ModelBackend', 'RoleModelBackend'])
+        self.assertEqual(all_perms.result, len(self.brandon.get_all_permissions()))
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'guardian.backends.ObjectPermissionBackend',
+        ],
+    )
+    def test_mixin(self):
+        with rolez.trace() as t:
+            self.assertTrue(self.jack.has_role_perm('test_app.change_blog', self.blog))
+            self.assertTrue(self.jack.has_role_perm('test_app.change_blog', self.blog))
+
+        first, second = t.checks
+        self.assertEqual(first.name, 'UserRoleMixin.has_role_perm')
+        self.assertEqual(first.detail['obj'], 'test_app.blog %s' % self.blog.pk)
+        has_perm, scoped = first.children
+        self.assertEqual([backend.name for backend in has_perm.children],
+                         ['ModelBackend', 'ObjectPermissionBackend'])
+        self.assertEqual(scoped.name, 'scoped roles')
+        self.assertEqual(len(scoped.queries), 1)
+        self.assertEqual(second.children[-1].name, 'cache hit')
+
+        self.assertEqual(t.as_dict()['children'][0]['result'], True)
+
+    def test_off(self):
+        original = auth_models._user_has_perm
+        self.assertIsNone(get_trace())
+        with step('anything') as recorded:
+            self.assertIsNone(recorded)
+        with rolez.trace() as outer:
+            with rolez.trace() as inner:
+                self.brandon.has_perm('test_app.change_author')
+            self.assertIs(get_trace(), outer)
+        self.assertEqual((len(outer.checks), len(inner.checks)), (0, 1))
+        self.assertIsNone(get_trace())
+        self.assertIs(auth_models._user_has_perm, original)  # restored
@@ -0,0 +1,126 @@
+import datetime
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission, Group
+from django.core.management import call_command
+from django.test import TestCase as ModelTestCase, override_settings
+
+from rolez.backend import RoleModelBackend
+from rolez.util import get_role_model, get_role_index, get_all_perms
+from rolez.warm import warm, get_recent_users
+from rolez.testing import run_on_commit
+from tests.test_app.models import Author, Blog
+
+UserModel = get_user_model()
+Role = get_role_model()
+
+
+@override_settings(ROLE_SHARED_CACHE=True)
+class WarmTests(ModelTestCase):
+    def setUp(self):
+        self.admins_group = Group.objects.create(name='admins')
+        self.brandon = UserModel.objects.create(username='brandon')
+        self.jack = UserModel.objects.create(username='jack')
+        self.brandon.groups.add(self.admins_group)
+
+        self.manager_role = Role.objects.create(name='manager')  # author change
+
+        content_type = ContentType.objects.get_for_model(Author)
+        self.change_author = Permission.objects.get(
+            content_type=content_type, codename='change_author')
+        self.delete_author = Permission.objects.get(
+            content_type=content_type, codename='delete_author')
+        content_type = ContentType.objects.get_for_model(Blog)
+        self.add_blog = Permission.objects.get(content_type=content_type, codename='add_blog')
+
+        self.manager_role.perms.add(self.change_author)
+        self.admins_group.permissions.add(self.manager_role.delegate)
+        self.jack.user_permissions.add(self.add_blog, self.manager_role.delegate)
+        run_on_commit()
+
+    def get(self, user):
+        return UserModel.objects.get(pk=user.pk)  # no instance caches
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'rolez.backend.RoleModelBackend',
+        ],
+    )
+    def test_backend_entries(self):
+        out = StringIO()
+        call_command('rolez_warm', stdout=out)
+        self.assertIn('warmed', out.getvalue())
+
+        brandon, jack = self.get(self.brandon), self.get(self.jack)
+        with self.assertNumQueries(0):
+            self.assertEqual(RoleModelBackend().get_all_permissions(brandon),
+                             {'test_app.change_author'})
+            self.assertEqual(RoleModelBackend().get_all_permissions(jack),
+                             {'test_app.change_author'})
+            self.assertTrue(get_role_index())
+            self.assertTrue(get_all_perms())
+
+        self.manager_role.perms.add(self.delete_author)
+        run_on_commit()  # a new generation
+        self.assertEqual(RoleModelBackend().get_all_permissions(self.get(self.brandon)),
+                         {'test_app.change_author', 'test_app.delete_author'})
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'])
+    def test_mixin_entries(self):
+        warm()
+        jack = self.get(self.jack)
+        with self.assertNumQueries(0):
+            self.assertEqual(jack.get_all_role_perms(), {
+                'test_app.add_blog', 'test_app.use_role_manager', 'test_app.change_author'})
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'])
+    def test_deactivated_and_demoted(self):
+        self.brandon.is_superuser = True
+        self.brandon.save()
+        warm()
+
+        self.jack.is_active = False
+        self.jack.save()
+        jack = self.get(self.jack)
+        self.assertEqual(jack.get_all_role_perms(), set())
+        self.assertIs(jack.has_role_perm('test_app.change_author'), False)
+
+        self.brandon.is_superuser = False
+        self.brandon.save()
+        self.assertEqual(self.get(self.brandon).get_all_role_perms(),
+                         {'test_app.use_role_manager', 'test_app.change_author'})
+
+    @override_settings(
+        AUTHENTICATION_BACKENDS=[
+            'django.contrib.auth.backends.ModelBackend',
+            'rolez.backend.RoleDefaultBackend',
+        ],
+        ROLE_AUTHENTICATED_ROLES=['member'],
+    )
+    def test_default_roles(self):
+        member_role = Role.objects.create(name='member')
+        member_role.perms.add(self.delete_author)
+        run_on_commit()
+        expected = self.get(self.jack).get_all_role_perms()
+        self.assertIn('test_app.delete_author', expected)
+
+        self.manager_role.perms.add(self.add_blog)
+        run_on_commit()  # a new generation, no entries
+        expected.add('test_app.add_blog')
+        warm()
+        jack = self.get(self.jack)
+        with self.assertNumQueries(0):
+            self.assertEqual(jack.get_all_role_perms(), expected)
+
+    def test_limits(self):
+        self.assertEqual(warm(max_bytes=1), {'users': 0, 'bytes': 0, 'complete': False})
+        self.assertFalse(warm(seconds=0)['complete'])
+        self.assertTrue(warm(users=1)['complete'])
+
+    def test_recent_users(self):
+        self.jack.last_login = datetime.datetime(2020, 1, 1)
+        self.jack.save()
+        self.assertEqual(get_recent_users(2)[0], self.jack.pk)